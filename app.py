@@ -1,46 +1,1379 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import telebot
+from telebot import types, apihelper
 import threading
 import time
+import heapq
+import queue
+import json
+import re
+import sqlite3
+import secrets
+import socket
+import hashlib
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
 import os
+import io
+import sys
+import selectors
+from contextlib import contextmanager
+from collections import deque, Counter, OrderedDict
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import cloudinary.exceptions
+
+# Pillow opsiyonel: yoksa fotoğraflar olduğu gibi yüklenir
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
 
 # Environment variables - RENDER İÇİN
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 INSTAGRAM_TOKEN = os.environ.get('INSTAGRAM_TOKEN')
+PUBLISH_WORKERS = int(os.environ.get('PUBLISH_WORKERS', 4))
+CONTAINER_READY_TIMEOUT = int(os.environ.get('CONTAINER_READY_TIMEOUT', 600))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 6000000))  # Cloudinary min 5MB
+MAX_VIDEO_SIZE = 100 * 1024 * 1024  # 100MB
+PHOTO_MAX_WIDTH = int(os.environ.get('PHOTO_MAX_WIDTH', 1080))  # Instagram bundan genişini küçültür
+PHOTO_JPEG_QUALITY = int(os.environ.get('PHOTO_JPEG_QUALITY', 85))
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_FILE_URL = TELEGRAM_API_URL + '/file/bot{0}/{1}'
+GRAPH_API_URL = os.environ.get('GRAPH_API_URL', 'https://graph.instagram.com')
+
+# Instagram paylaşım kotası (24 saatlik kayan pencere) ve hız limitleri
+PUBLISH_QUOTA_DEFAULT = int(os.environ.get('PUBLISH_QUOTA_DEFAULT', 100))
+PUBLISH_RATE_PER_MINUTE = float(os.environ.get('PUBLISH_RATE_PER_MINUTE', 10))
+PUBLISH_QUOTA_DEFER = int(os.environ.get('PUBLISH_QUOTA_DEFER', 1800))
+QUOTA_REFRESH_INTERVAL = 300
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', 25))
+TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE', 1))
+
+# Geçici hatalarda otomatik tekrar deneme
+MAX_PUBLISH_ATTEMPTS = int(os.environ.get('MAX_PUBLISH_ATTEMPTS', 4))
+RETRY_BASE_DELAY = int(os.environ.get('RETRY_BASE_DELAY', 60))
+RETRY_MAX_DELAY = int(os.environ.get('RETRY_MAX_DELAY', 3600))
+
+# Graph API'nin "limit aşıldı" hata kodları; bu hatalarda gönderi ertelenir
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613}
+PUBLISH_LIMIT_SUBCODE = 2207042
+
+# Geçici Graph API hataları: bilinmeyen/servis hatası ve "media not ready" (9007)
+TRANSIENT_ERROR_CODES = {1, 2, 9007}
+
+# (connect, read) timeout'ları, Graph API endpoint'ine göre
+GRAPH_TIMEOUTS = {
+    'content_publishing_limit': (5, 15),
+    'media': (5, 60),
+    'container_status': (5, 15),
+    'media_publish': (5, 30)
+}
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 20))
+MEDIA_GROUP_WAIT = float(os.environ.get('MEDIA_GROUP_WAIT', 2))
+MAX_CAROUSEL_ITEMS = 10
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')  # 'polling' veya 'webhook'
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') or os.environ.get('RENDER_EXTERNAL_URL')
+# Verilmezse bot token'ından türetilir: bütün instance'lar aynı anahtarı kaydeder ve kabul eder
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or hashlib.sha256(f"webhook:{TELEGRAM_TOKEN}".encode()).hexdigest()
+UPDATE_WORKERS = int(os.environ.get('UPDATE_WORKERS', 4))
+UPDATE_QUEUE_SIZE = int(os.environ.get('UPDATE_QUEUE_SIZE', 100))
+DB_PATH = os.environ.get('DB_PATH', 'nexabot.db')
+DB_FLUSH_INTERVAL = float(os.environ.get('DB_FLUSH_INTERVAL', 0.5))
+MEDIA_CACHE_SIZE = int(os.environ.get('MEDIA_CACHE_SIZE', 500))
+MEDIA_CACHE_PERSIST = os.environ.get('MEDIA_CACHE_PERSIST', '1') == '1'
+SESSION_IDLE_TTL = int(os.environ.get('SESSION_IDLE_TTL', 86400))
+SESSION_MAX = int(os.environ.get('SESSION_MAX', 10000))
+NOTIFY_COALESCE_WINDOW = float(os.environ.get('NOTIFY_COALESCE_WINDOW', 3))
+ASSET_CLEANUP_GRACE = int(os.environ.get('ASSET_CLEANUP_GRACE', 3600))
+ASSET_DELETE_RATE_PER_HOUR = float(os.environ.get('ASSET_DELETE_RATE_PER_HOUR', 100))
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' veya 'json'
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0))  # saniye, 0 = kapalı
+# Lease sahibi süreç başına tekildir: aynı adla yeniden başlayan süreç, ölen sürecin
+# lease'lerini kendi sanıp sonsuza kadar yenilememeli
+INSTANCE_ID = (os.environ.get('INSTANCE_ID') or f'{socket.gethostname()}-{os.getpid()}') + '-' + secrets.token_hex(4)
+LEASE_TTL = int(os.environ.get('LEASE_TTL', 60))
+
+# Instagram uzun ömürlü token'ları 60 gün geçerli; bitmesine 7 gün kala yenilenir
+TOKEN_LIFETIME = 60 * 86400
+TOKEN_REFRESH_MARGIN = 7 * 86400
 
 # CRITICAL: Token kontrolü
 if not TELEGRAM_TOKEN:
     raise ValueError("❌ TELEGRAM_TOKEN environment variable is required! Render Dashboard'dan ayarlayın.")
-if not INSTAGRAM_TOKEN:
-    raise ValueError("❌ INSTAGRAM_TOKEN environment variable is required! Render Dashboard'dan ayarlayın.")
+if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+    raise ValueError("❌ BOT_MODE=webhook için WEBHOOK_URL environment variable is required!")
+
+def log(message):
+    """Okunabilir (emoji'li) log satırı yazar.
+    
+    LOG_FORMAT=json ise stderr'e gider; stdout'a sadece log_event JSON satırı yazar.
+    """
+    print(message, file=sys.stderr if LOG_FORMAT == 'json' else sys.stdout)
 
-print("=" * 60)
-print("🚀 NEXABOT STARTING...")
-print(f"🔑 TELEGRAM_TOKEN: {'✅' if TELEGRAM_TOKEN else '❌'}")
-print(f"🔑 INSTAGRAM_TOKEN: {'✅' if INSTAGRAM_TOKEN else '❌'}")
+log("=" * 60)
+log("🚀 NEXABOT STARTING...")
+log(f"🔑 TELEGRAM_TOKEN: {'✅' if TELEGRAM_TOKEN else '❌'}")
+log(f"🔑 INSTAGRAM_TOKEN: {'✅' if INSTAGRAM_TOKEN else '❌ (sadece /link ile bağlanan hesaplar paylaşabilir)'}")
 
 # Cloudinary Configuration - RENDER İÇİN
 cloudinary.config(
     cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
     api_key=os.environ.get('CLOUDINARY_API_KEY'),
     api_secret=os.environ.get('CLOUDINARY_API_SECRET'),
+    upload_prefix=os.environ.get('CLOUDINARY_UPLOAD_PREFIX'),
     secure=True
 )
 
-print(f"☁️ CLOUDINARY: {'✅' if os.environ.get('CLOUDINARY_CLOUD_NAME') else '❌'}")
-print("=" * 60)
+log(f"☁️ CLOUDINARY: {'✅' if os.environ.get('CLOUDINARY_CLOUD_NAME') else '❌'}")
+log("=" * 60)
+
+def make_http_session(pool_size):
+    """Keep-alive bağlantıları tekrar kullanan, paylaşımlı bir requests session'ı.
+    
+    Sadece bağlantı kurulamadığında tekrar dener; istek sunucuya ulaştıysa
+    (ör. media_publish) tekrar gönderilmez.
+    """
+    retry = Retry(total=None, connect=3, read=False, status=False, redirect=False,
+                  backoff_factor=0.3, allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Her publish worker'ı bir albümün bütün çocuklarını aynı anda açabilir; kalan
+# yer kota sorgusu, token yenileme ve /link içindir
+graph_session = make_http_session(PUBLISH_WORKERS * MAX_CAROUSEL_ITEMS + 4)
+telegram_session = make_http_session(PUBLISH_WORKERS + INGEST_WORKERS + 4)
+
+# telebot varsayılan olarak thread başına 10 dakikalık session açar;
+# bunun yerine bütün thread'ler aynı bağlantı havuzunu kullansın
+apihelper.session = telegram_session
+apihelper.SESSION_TIME_TO_LIVE = None
+apihelper.CONNECT_TIMEOUT = 5
+apihelper.API_URL = TELEGRAM_API_URL + '/bot{0}/{1}'
+
+# Webhook modunda update'leri kendi worker'larımız işler, telebot'un thread havuzu gerekmez
+bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=(BOT_MODE != 'webhook'))
+
+# Webhook ile gelen update'ler: sınırlı kuyruk + tekrar gelenleri ayıklamak için son id'ler
+update_queue = queue.Queue(maxsize=UPDATE_QUEUE_SIZE)
+seen_update_ids = OrderedDict()
+seen_updates_lock = threading.Lock()
+
+class TokenBucket:
+    """Saniyede `rate` token dolan, en fazla `capacity` token biriktiren kova."""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def try_acquire(self):
+        """Token alınabildiyse 0, alınamadıysa beklenmesi gereken süreyi döner."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+    
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+    
+    def idle(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.updated
+            return self.tokens + elapsed * self.rate >= self.capacity
+
+# Instagram limitleri hesap başına; her hesabın kendi kovası ve kotası var
+account_limits = {}  # hesap -> {'bucket', 'usage', 'total', 'checked_at'}
+quota_lock = threading.Lock()
+
+def get_account_limits(account):
+    with quota_lock:
+        limits = account_limits.get(account)
+        if limits is None:
+            limits = account_limits[account] = {
+                'bucket': TokenBucket(PUBLISH_RATE_PER_MINUTE / 60, max(PUBLISH_RATE_PER_MINUTE, 1)),
+                'usage': 0,
+                'total': PUBLISH_QUOTA_DEFAULT,
+                'checked_at': 0.0
+            }
+        return limits
+
+telegram_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+chat_buckets = {}
+chat_buckets_lock = threading.Lock()
+
+def throttle_telegram(chat_id):
+    """Telegram'ın sohbet başına ve genel mesaj limitlerine uyana kadar bekler."""
+    with chat_buckets_lock:
+        if len(chat_buckets) > 5000:
+            for idle_chat in [key for key, bucket in chat_buckets.items() if bucket.idle()]:
+                del chat_buckets[idle_chat]
+        bucket = chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_RATE, 3)
+    
+    bucket.acquire()
+    telegram_bucket.acquire()
+
+def send_message(chat_id, text, **kwargs):
+    throttle_telegram(chat_id)
+    return bot.send_message(chat_id, text, **kwargs)
+
+# NOTIFICATIONS - paylaşım akışındaki bildirimler outbox'a yazılır ve ayrı thread'lerden
+# gönderilir; Telegram'ın yavaşlığı ya da hatası paylaşımı etkilemez. Aynı kullanıcıya
+# NOTIFY_COALESCE_WINDOW içinde biriken bildirimler tek mesajda birleştirilir.
+# Outbox bellekte tutulur; yeniden başlatmada gönderilmemiş bildirimler kaybolur.
+NOTIFY_WORKERS = 2
+NOTIFY_MAX_ATTEMPTS = 5
+TELEGRAM_MESSAGE_LIMIT = 4096
+outbox = {}  # user_id -> {'texts': [...], 'due': zaman, 'attempts': n}
+outbox_heap = []  # (due, user_id)
+outbox_cond = threading.Condition()
+notifying_users = set()  # aynı kullanıcıya mesajlar sırayla gitsin
+
+def escape_markdown(text):
+    """Kullanıcıdan gelen metni Telegram Markdown'ında düz metin olarak gösterir."""
+    for char in ('_', '*', '`', '['):
+        text = text.replace(char, '\\' + char)
+    return text
+
+def strip_markdown(text):
+    """Markdown metnin düz hali: kaçışlar açılır, biçim işaretleri (*, _, `) silinir."""
+    return re.sub(r'\\([_*`\[])|[_*`]', lambda match: match.group(1) or '', text)
+
+def notify(user_id, text, markdown=False):
+    """Bildirimi outbox'a ekler; beklemeden döner.
+    
+    Her bildirim (Markdown, düz metin) çifti olarak tutulur; Markdown ayrıştırılamazsa
+    kullanıcı ters eğik çizgileri değil düz metni görür.
+    """
+    if markdown:
+        text = (text, strip_markdown(text))
+    else:
+        text = (escape_markdown(text), text)
+    
+    with outbox_cond:
+        entry = outbox.get(user_id)
+        if entry is None:
+            entry = outbox[user_id] = {'texts': [], 'due': time.time() + NOTIFY_COALESCE_WINDOW, 'attempts': 0}
+            heapq.heappush(outbox_heap, (entry['due'], user_id))
+            outbox_cond.notify()
+        else:
+            inc_counter('nexabot_notifications_total', result='merged')
+        entry['texts'].append(text)
+
+def schedule_notification(user_id, entry, due):
+    """Gönderilemeyen bildirimleri, bu arada gelenlerin önüne koyarak tekrar kuyruğa alır."""
+    with outbox_cond:
+        waiting = outbox.get(user_id)
+        if waiting is not None:
+            entry['texts'].extend(waiting['texts'])
+        entry['due'] = max(due, waiting['due']) if waiting else due
+        outbox[user_id] = entry
+        heapq.heappush(outbox_heap, (entry['due'], user_id))
+        outbox_cond.notify()
+
+def next_notification():
+    with outbox_cond:
+        while True:
+            if not outbox_heap:
+                outbox_cond.wait()
+                continue
+            
+            due, user_id = outbox_heap[0]
+            delay = due - time.time()
+            if delay > 0:
+                outbox_cond.wait(timeout=delay)
+                continue
+            
+            heapq.heappop(outbox_heap)
+            entry = outbox.get(user_id)
+            # Tekrar kuyruğa alınmış bildirimin eski heap kaydı
+            if entry is None or entry['due'] != due:
+                continue
+            if user_id in notifying_users:
+                entry['due'] = time.time() + 1
+                heapq.heappush(outbox_heap, (entry['due'], user_id))
+                continue
+            
+            del outbox[user_id]
+            notifying_users.add(user_id)
+            return user_id, entry
+
+def pack_notification(texts):
+    """(Markdown, düz) metin çiftlerini Telegram'ın mesaj sınırına sığan gruplara böler.
+    
+    [(markdown mesaj, düz mesaj, metin sayısı)] döner; düz metin hiçbir zaman
+    Markdown halinden uzun olmadığından aynı gruplama ikisine de uyar.
+    """
+    messages = []
+    for markdown, plain in texts:
+        markdown = markdown[:TELEGRAM_MESSAGE_LIMIT]
+        plain = plain[:TELEGRAM_MESSAGE_LIMIT]
+        if messages and len(messages[-1][0]) + 2 + len(markdown) <= TELEGRAM_MESSAGE_LIMIT:
+            last_markdown, last_plain, count = messages[-1]
+            messages[-1] = (last_markdown + '\n\n' + markdown, last_plain + '\n\n' + plain, count + 1)
+        else:
+            messages.append((markdown, plain, 1))
+    return messages
+
+def deliver_notification(user_id, entry):
+    for message_text, plain_text, count in pack_notification(entry['texts']):
+        try:
+            send_message(user_id, message_text, parse_mode='Markdown')
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 400 and "can't parse entities" in str(e.description):
+                # Biçim bozuksa en azından düz metin olarak ulaşsın
+                send_message(user_id, plain_text)
+            else:
+                raise
+        del entry['texts'][:count]
+        inc_counter('nexabot_notifications_total', result='sent')
+
+def notification_sender():
+    while True:
+        user_id, entry = next_notification()
+        try:
+            deliver_notification(user_id, entry)
+        except Exception as e:
+            entry['attempts'] += 1
+            retry_after = None
+            if isinstance(e, telebot.apihelper.ApiTelegramException):
+                if e.error_code in (400, 403):
+                    # Kullanıcı botu engellemiş ya da sohbet yok; tekrar denemenin anlamı yok
+                    entry['attempts'] = NOTIFY_MAX_ATTEMPTS
+                elif e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+            
+            if entry['attempts'] >= NOTIFY_MAX_ATTEMPTS:
+                inc_counter('nexabot_notifications_total', len(entry['texts']), result='dropped')
+                log(f"❌ Bildirim gönderilemedi ({user_id}), bırakıldı: {e}")
+            else:
+                inc_counter('nexabot_notifications_total', result='retry')
+                delay = retry_after or min(2 ** entry['attempts'], 60)
+                log(f"⚠️ Bildirim gönderilemedi ({user_id}), {delay}s sonra tekrar: {e}")
+                schedule_notification(user_id, entry, time.time() + delay)
+        finally:
+            with outbox_cond:
+                notifying_users.discard(user_id)
+
+# Storage - bellekteki kopyalar, kalıcı hali SQLite'ta (DB_PATH)
+user_sessions = OrderedDict()  # en uzun süredir kullanılmayan başta
+# Sadece bekleyen/işlenen gönderiler (id -> post); paylaşılan ve hatalı olanlar
+# bellekten çıkar, geçmiş /posts'ta veritabanından okunur
+scheduled_posts = {}
+index_lock = threading.Lock()
+POSTS_PAGE_SIZE = 5
+
+# ('status', ...) ve ('media_type', ...) sayaçları; açılışta veritabanından sayılır,
+# sonra gönderi durum değiştirdikçe güncellenir
+post_counts = Counter()
+
+# Bekleyen/işlenen gönderilerin kullandığı Cloudinary asset'leri (public_id -> adet);
+# bunlar oturum temizliğinde silinmez
+active_assets = Counter()
+ACTIVE_STATUSES = ('pending', 'processing')
+
+# Scheduler kuyruğu: sadece bekleyen gönderiler, (zaman, id, post) olarak sıralı
+pending_heap = []
+scheduler_cond = threading.Condition()
+
+# Zamanı gelen gönderiler publish worker'larına bu kuyrukla dağıtılır
+publish_queue = queue.Queue()
+# Boşta worker yokken gönderi alınmaz; böylece diğer instance'lar kalan gönderileri alabilir
+publish_slots = threading.Semaphore(PUBLISH_WORKERS)
+
+# Periyodik döngüler (lease, token, oturum, asset, profiler) time.sleep yerine bu
+# olayda bekler; set edilince hepsi beklemeden uyanır. Bekleyen thread'in çerçevesi
+# threading.py'de durduğu için profiler onu boşta sayar.
+stop_event = threading.Event()
 
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+# Zamanı gelmiş gönderiler hesap başına kuyruklarda bekler; boşalan worker'lar
+# hesaplar arasında sırayla (round-robin) dağıtılır, böylece bir hesabın birikmiş
+# gönderileri ya da hız limiti diğerlerini bekletmez.
+ready_queues = {}  # hesap -> deque(post)
+ready_accounts = deque()  # sırası gelen hesap başta
+ready_cond = threading.Condition()
+publish_times = deque(maxlen=1000)
 
-# Storage
-user_sessions = {}
-scheduled_posts = []
-post_id_counter = 1
+# Container'ın hazır olma süreleri (saniye), ilk poll aralığını belirler
+container_ready_stats = {
+    'image': deque(maxlen=50),
+    'video': deque(maxlen=50),
+    'carousel': deque(maxlen=50)
+}
+
+# Medya indirme/yükleme işleri - Telegram handler'larını bloklamamak için
+ingest_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+ingest_active = 0
+ingest_lock = threading.Lock()
+ingest_latencies = deque(maxlen=200)  # (kuyrukta bekleme, toplam) saniye
+
+# Telegram albümleri (media group) ayrı mesajlar olarak gelir; burada toplanıp
+# tek bir CAROUSEL oturumuna çevrilir. group_id -> {'items': {message_id: sonuç}, ...}
+media_groups = {}
+media_groups_lock = threading.Lock()
+
+MEDIA_LABELS = {
+    'image': 'Fotoğraf',
+    'video': 'Video',
+    'carousel': 'Albüm'
+}
+
+def media_label(media_type):
+    return MEDIA_LABELS.get(media_type, 'Gönderi')
+
+# DATABASE
+# posts tablosunda sık sorgulanan alanlar kolon, geri kalan post alanları
+# (post_id, completed_at, stage, ...) 'extra' JSON kolonunda tutulur.
+# 'revision' veritabanındaki her değişiklikte artar; bellekteki değer bu instance'ın
+# bildiği son revision'dır, yerel değişiklikler (stage vb.) onu artırmaz.
+POST_COLUMNS = (
+    'id', 'user_id', 'media_url', 'media_type', 'caption', 'scheduled_time',
+    'status', 'created_at', 'attempts', 'error_message', 'revision'
+)
+
+# Her eleman bir şema versiyonu; PRAGMA user_version ile takip edilir
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        media_url TEXT NOT NULL,
+        media_type TEXT NOT NULL,
+        caption TEXT NOT NULL,
+        scheduled_time TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error_message TEXT,
+        extra TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE INDEX IF NOT EXISTS idx_posts_status_time ON posts (status, scheduled_time);
+    CREATE INDEX IF NOT EXISTS idx_posts_user_created ON posts (user_id, created_at);
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS media_cache (
+        cache_key TEXT PRIMARY KEY,
+        public_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_media_cache_public_id ON media_cache (public_id);
+    """,
+    """
+    ALTER TABLE posts ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE posts ADD COLUMN lease_owner TEXT;
+    ALTER TABLE posts ADD COLUMN lease_expires REAL;
+    ALTER TABLE posts ADD COLUMN updated_at REAL NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS idx_posts_updated ON posts (updated_at);
+    CREATE INDEX IF NOT EXISTS idx_posts_lease ON posts (status, lease_expires);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        user_id INTEGER PRIMARY KEY,
+        ig_user_id TEXT NOT NULL,
+        username TEXT,
+        access_token TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        refreshed_at REAL NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_accounts_ig_user ON accounts (ig_user_id);
+    CREATE INDEX IF NOT EXISTS idx_accounts_expires ON accounts (expires_at);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS asset_cleanup (
+        public_id TEXT PRIMARY KEY,
+        resource_type TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        delete_after REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_asset_cleanup_due ON asset_cleanup (delete_after);
+    """,
+]
+
+db = None
+db_lock = threading.Lock()
+db_write_queue = queue.Queue()
+
+def init_db(path=None):
+    global db
+    
+    db = sqlite3.connect(path or DB_PATH, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    
+    with db_lock:
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            log(f"🗄️ DB migration {number} uygulanıyor...")
+            db.executescript(script)
+            db.execute(f'PRAGMA user_version = {number}')
+        db.commit()
+
+def post_to_row(post):
+    row = {column: post.get(column) for column in POST_COLUMNS}
+    extra = {key: value for key, value in post.items() if key not in POST_COLUMNS}
+    row['extra'] = json.dumps(extra, default=str)
+    return row
+
+def row_to_post(row):
+    post = {column: row[column] for column in POST_COLUMNS}
+    post.update(json.loads(row['extra'] or '{}'))
+    return post
+
+def insert_post(post):
+    """Yeni gönderiyi hemen yazar ve veritabanının verdiği id'yi döner."""
+    post.setdefault('revision', 0)
+    row = post_to_row(post)
+    del row['id']
+    row['updated_at'] = time.time()
+    columns = ', '.join(row)
+    placeholders = ', '.join(f':{column}' for column in row)
+    
+    with db_lock:
+        cursor = db.execute(f'INSERT INTO posts ({columns}) VALUES ({placeholders})', row)
+        db.commit()
+    return cursor.lastrowid
+
+def persist_post(post):
+    db_write_queue.put(('post', post['id'], post_to_row(post)))
+
+def apply_post_changes(post, changes):
+    old_status = post['status']
+    old_time = post['scheduled_time']
+    post.update(changes)
+    
+    if post['status'] != old_status:
+        unindex_post(post, old_status)
+        index_post(post)
+
+def update_post(post, **changes):
+    """İşlenen gönderinin extra alanlarını (stage vb.) değiştirir, yazmayı db_writer'a bırakır.
+    
+    Durum ve zaman geçişleri için claim_post / release_post kullanılır; db_writer
+    sadece lease'i hâlâ bu instance'ta olan gönderilerin extra kolonunu yazar.
+    """
+    apply_post_changes(post, changes)
+    persist_post(post)
+
+# LEASES - birden fazla instance aynı veritabanını paylaşabilir.
+# pending -> processing geçişi compare-and-set ile yapılır; gönderiyi alan instance
+# lease_owner olur ve lease'i heartbeat ile uzatır. Lease süresi dolan gönderiler
+# (instance çöktü) tekrar pending yapılır ve herhangi bir instance tarafından alınabilir.
+def claim_post(post):
+    """Gönderiyi bu instance adına alır; başka biri almış ya da değiştirmişse False döner."""
+    now = time.time()
+    with db_lock:
+        cursor = db.execute(
+            "UPDATE posts SET status = 'processing', revision = revision + 1, "
+            "lease_owner = ?, lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'pending' AND revision = ?",
+            (INSTANCE_ID, now + LEASE_TTL, now, post['id'], post.get('revision', 0))
+        )
+        db.commit()
+    
+    if cursor.rowcount != 1:
+        inc_counter('nexabot_lease_total', result='conflict')
+        return False
+    
+    apply_post_changes(post, {'status': 'processing', 'revision': post.get('revision', 0) + 1})
+    update_post(post, stage='queued')
+    inc_counter('nexabot_lease_total', result='claimed')
+    return True
+
+def release_post(post, **changes):
+    """İşlenen gönderinin durumunu değiştirir ve lease'i bırakır.
+    
+    Lease başka bir instance'a geçmişse değişiklik yazılmaz ve False döner.
+    Paylaşım tamamlandıysa lease'e bakılmaz; aksi halde gönderiyi geri alan
+    instance onu tekrar paylaşabilirdi.
+    """
+    new_post = dict(post, **changes)
+    row = post_to_row(new_post)
+    row.update(instance=INSTANCE_ID, updated_at=time.time())
+    # revision veritabanında artırılır; db_writer'ın extra yazmaları da onu artırmış olabilir
+    assignments = ', '.join(f'{column} = :{column}' for column in POST_COLUMNS[1:-1] + ('extra', 'updated_at'))
+    
+    if new_post['status'] == 'completed':
+        condition = "status != 'completed'"
+    else:
+        condition = "status = 'processing' AND lease_owner = :instance"
+    
+    with db_lock:
+        cursor = db.execute(
+            f'UPDATE posts SET {assignments}, revision = revision + 1, lease_owner = NULL, lease_expires = NULL '
+            f'WHERE id = :id AND {condition}',
+            row
+        )
+        revision = db.execute('SELECT revision FROM posts WHERE id = ?', (post['id'],)).fetchone()[0]
+        db.commit()
+    
+    if cursor.rowcount != 1:
+        inc_counter('nexabot_lease_total', result='lost')
+        log(f"⚠️ Post {post['id']} lease'i kaybedildi, değişiklik yazılmadı")
+        return False
+    
+    apply_post_changes(post, dict(changes, revision=revision))
+    return True
+
+def confirm_lease(post):
+    """Paylaşımdan hemen önce lease'in hâlâ bu instance'ta olduğunu doğrular ve uzatır.
+    
+    Takılıp lease'i geri alınan bir worker, gönderiyi devralan instance'la aynı
+    anda paylaşmasın diye media_publish'ten önce çağrılır.
+    """
+    with db_lock:
+        cursor = db.execute(
+            "UPDATE posts SET lease_expires = ? WHERE id = ? AND status = 'processing' AND lease_owner = ?",
+            (time.time() + LEASE_TTL, post['id'], INSTANCE_ID)
+        )
+        db.commit()
+    return cursor.rowcount == 1
+
+def renew_leases():
+    with db_lock:
+        db.execute(
+            "UPDATE posts SET lease_expires = ? WHERE status = 'processing' AND lease_owner = ?",
+            (time.time() + LEASE_TTL, INSTANCE_ID)
+        )
+        db.commit()
+
+def reclaim_expired_leases():
+    """Lease süresi dolmuş (ya da lease'siz kalmış eski) işlenen gönderileri pending yapar."""
+    now = time.time()
+    with db_lock:
+        cursor = db.execute(
+            "UPDATE posts SET status = 'pending', revision = revision + 1, "
+            "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE status = 'processing' AND (lease_expires IS NULL OR lease_expires < ?)",
+            (now, now)
+        )
+        db.commit()
+    
+    if cursor.rowcount:
+        inc_counter('nexabot_lease_total', cursor.rowcount, result='reclaimed')
+        log(f"♻️ {cursor.rowcount} gönderinin lease'i dolmuş, tekrar kuyruğa alındı")
+    return cursor.rowcount
+
+def apply_remote_post(row):
+    """Veritabanındaki satır bellektekinden yeniyse (başka bir instance değiştirmiş) uygular."""
+    fresh = row_to_post(row)
+    post = scheduled_posts.get(fresh['id'])
+    
+    if post is None:
+        # Bellekte sadece aktif gönderiler tutulur
+        if fresh['status'] not in ACTIVE_STATUSES:
+            return
+        register_post(fresh)
+        if fresh['status'] == 'pending':
+            enqueue_post(fresh, datetime.fromisoformat(fresh['scheduled_time']))
+        return
+    
+    # Lease bu instance'taysa gönderinin tek yazarı biziz; satırdaki değişiklikler bizim
+    if row['lease_owner'] == INSTANCE_ID or fresh['revision'] <= post.get('revision', 0):
+        return
+    
+    was_queued = (post['status'], post['scheduled_time'])
+    apply_post_changes(post, fresh)
+    if post['status'] == 'pending' and was_queued != ('pending', post['scheduled_time']):
+        enqueue_post(post, datetime.fromisoformat(post['scheduled_time']))
+
+def refresh_post(post_id):
+    with db_lock:
+        row = db.execute('SELECT * FROM posts WHERE id = ?', (post_id,)).fetchone()
+    if row:
+        apply_remote_post(row)
+
+def sync_posts(since):
+    """since'ten sonra değişen gönderileri okur; sonraki çağrı için yeni since'i döner."""
+    with db_lock:
+        rows = db.execute('SELECT * FROM posts WHERE updated_at >= ? ORDER BY id', (since,)).fetchall()
+    
+    for row in rows:
+        apply_remote_post(row)
+    
+    # Saat farkları ve aynı anda commit edilen yazmalar için biraz geriden başla
+    latest = max((row['updated_at'] for row in rows), default=since)
+    return max(latest - 5, since)
+
+def lease_keeper():
+    since = time.time()
+    while not stop_event.wait(LEASE_TTL / 6):
+        try:
+            renew_leases()
+            reclaim_expired_leases()
+            since = sync_posts(since)
+        except Exception as e:
+            log(f"❌ Lease keeper error: {e}")
+
+def index_post(post):
+    with index_lock:
+        post_counts[('status', post['status'])] += 1
+        if post['status'] in ACTIVE_STATUSES:
+            scheduled_posts[post['id']] = post
+            for public_id, _ in media_assets(post):
+                active_assets[public_id] += 1
+
+def unindex_post(post, status):
+    with index_lock:
+        post_counts[('status', status)] -= 1
+        if status in ACTIVE_STATUSES:
+            scheduled_posts.pop(post['id'], None)
+            for public_id, _ in media_assets(post):
+                active_assets[public_id] -= 1
+                if active_assets[public_id] <= 0:
+                    del active_assets[public_id]
+
+def register_post(post):
+    index_post(post)
+    with index_lock:
+        post_counts[('media_type', post['media_type'])] += 1
+
+def user_posts_page(user_id, status='all', page=0):
+    """Kullanıcının gönderilerinden bir sayfa ve toplam sayıyı döner.
+    
+    Veritabanından (user_id, created_at) indeksiyle okunur. Bekleyen gönderiler en
+    yakın zamandan, diğerleri en yeniden başlar; bellekte olanların güncel hali döner.
+    """
+    if status == 'all':
+        where, params = 'user_id = ?', (user_id,)
+    else:
+        where, params = 'user_id = ? AND status = ?', (user_id, status)
+    order = 'scheduled_time, id' if status == 'pending' else 'created_at DESC, id DESC'
+    
+    # Planlayıcı status indekslerini seçip o durumdaki bütün gönderileri tarayabiliyor;
+    # kullanıcının gönderileri her zaman az olduğundan user_id indeksi zorlanır
+    with db_lock:
+        total = db.execute(
+            f'SELECT COUNT(*) FROM posts INDEXED BY idx_posts_user_created WHERE {where}', params
+        ).fetchone()[0]
+        rows = db.execute(
+            f'SELECT * FROM posts INDEXED BY idx_posts_user_created WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?',
+            params + (POSTS_PAGE_SIZE, page * POSTS_PAGE_SIZE)
+        ).fetchall()
+    
+    return [scheduled_posts.get(row['id']) or row_to_post(row) for row in rows], total
+
+def flush_writes(batch):
+    # Aynı kayıt için sadece son hali yazılır; oturum verisi None ise silinir
+    posts = {}
+    sessions = {}
+    assets = {}
+    for kind, key, data in batch:
+        if kind == 'post':
+            posts[key] = data
+        elif kind == 'asset':
+            assets[key] = data
+        else:
+            sessions[key] = data
+    
+    now = datetime.now().isoformat()
+    for row in posts.values():
+        row.update(instance=INSTANCE_ID, updated_at=time.time())
+    
+    with db_lock:
+        # Sadece extra yazılır ve sadece lease hâlâ bizdeyse; durum geçişleri
+        # claim/release/reclaim ile doğrudan yapılır
+        db.executemany(
+            'UPDATE posts SET extra = :extra, revision = revision + 1, updated_at = :updated_at '
+            "WHERE id = :id AND status = 'processing' AND lease_owner = :instance AND lease_expires IS NOT NULL",
+            posts.values()
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)',
+            [(user_id, data, now) for user_id, data in sessions.items() if data is not None]
+        )
+        db.executemany(
+            'DELETE FROM sessions WHERE user_id = ?',
+            [(user_id,) for user_id, data in sessions.items() if data is None]
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO asset_cleanup (public_id, resource_type, reason, delete_after) VALUES (?, ?, ?, ?)',
+            [(public_id,) + data for public_id, data in assets.items()]
+        )
+        db.commit()
+
+def db_writer():
+    while True:
+        batch = [db_write_queue.get()]
+        # Kısa bir süre daha bekleyip gelen yazmaları tek transaction'da topla
+        deadline = time.time() + DB_FLUSH_INTERVAL
+        while len(batch) < 500:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(db_write_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            flush_writes(batch)
+        except Exception as e:
+            log(f"❌ DB write error: {e}")
+
+def load_state():
+    """Açılışta gönderileri ve oturumları yükler, yarım kalanları yeniden kuyruğa alır."""
+    # Çökme/deploy sırasında işlenmekte olan gönderiler lease'leri dolduysa tekrar denenir;
+    # lease'i hâlâ geçerli olanlar başka bir instance'ta işleniyordur
+    requeued = reclaim_expired_leases()
+    
+    # Sadece bekleyen/işlenen gönderiler yüklenir (status, scheduled_time indeksiyle);
+    # geçmiş ne kadar büyürse büyüsün açılış süresi ve bellek değişmez
+    with db_lock:
+        post_rows = db.execute(
+            "SELECT * FROM posts WHERE status IN ('pending', 'processing') ORDER BY status, scheduled_time"
+        ).fetchall()
+        count_rows = db.execute(
+            'SELECT status, media_type, COUNT(*) AS count FROM posts GROUP BY status, media_type'
+        ).fetchall()
+        session_rows = db.execute('SELECT user_id, data FROM sessions').fetchall()
+    
+    for row in post_rows:
+        post = row_to_post(row)
+        register_post(post)
+        
+        if post['status'] == 'pending':
+            enqueue_post(post, datetime.fromisoformat(post['scheduled_time']))
+    
+    with index_lock:
+        post_counts.clear()
+        for row in count_rows:
+            post_counts[('status', row['status'])] += row['count']
+            post_counts[('media_type', row['media_type'])] += row['count']
+    
+    # Süresi dolmuş olanları session_sweeper temizler
+    sessions = [(row['user_id'], json.loads(row['data'])) for row in session_rows]
+    for user_id, session in sorted(sessions, key=lambda item: item[1].get('last_active', 0)):
+        user_sessions[user_id] = session
+    
+    log(f"🗄️ {len(post_rows)} gönderi, {len(session_rows)} oturum yüklendi ({requeued} yeniden kuyruğa alındı)")
+
+# ACCOUNTS - kullanıcıların /link ile bağladığı Instagram hesapları.
+# Gönderi, zamanlandığı andaki hesabın ig_user_id'sini 'account' alanında taşır;
+# bağlı hesabı olmayanlar INSTAGRAM_TOKEN'ın hesabını ('default') kullanır.
+DEFAULT_ACCOUNT = 'default'
+
+def post_account(post):
+    return post.get('account') or DEFAULT_ACCOUNT
+
+def get_linked_account(user_id):
+    with db_lock:
+        row = db.execute('SELECT * FROM accounts WHERE user_id = ?', (user_id,)).fetchone()
+    return dict(row) if row else None
+
+def account_token(account):
+    """Hesabın güncel access token'ı; hesap bağlı değilse None."""
+    if account == DEFAULT_ACCOUNT:
+        return INSTAGRAM_TOKEN
+    with db_lock:
+        row = db.execute(
+            'SELECT access_token FROM accounts WHERE ig_user_id = ? ORDER BY refreshed_at DESC LIMIT 1',
+            (account,)
+        ).fetchone()
+    return row['access_token'] if row else None
+
+def link_account(user_id, access_token):
+    """Token'ı doğrular ve kullanıcıya bağlar; (hesap, None) ya da (None, hata) döner."""
+    try:
+        result = graph_session.get(
+            f'{GRAPH_API_URL}/me',
+            params={'fields': 'user_id,username', 'access_token': access_token},
+            timeout=GRAPH_TIMEOUTS['media']
+        ).json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # İstisna mesajı token'lı URL'i içerebilir; sadece türü loglanır
+        log(f"⚠️ Token doğrulama isteği başarısız: {type(e).__name__}")
+        return None, "Instagram'a ulaşılamadı, biraz sonra tekrar deneyin"
+    if 'error' in result or not (result.get('user_id') or result.get('id')):
+        return None, result.get('error', {}).get('message', 'Token doğrulanamadı')
+    
+    now = time.time()
+    account = {
+        'user_id': user_id,
+        'ig_user_id': str(result.get('user_id') or result['id']),
+        'username': result.get('username'),
+        'access_token': access_token,
+        'expires_at': now + TOKEN_LIFETIME,
+        'refreshed_at': now,
+        'created_at': datetime.now().isoformat()
+    }
+    with db_lock:
+        db.execute(
+            'INSERT OR REPLACE INTO accounts (user_id, ig_user_id, username, access_token, expires_at, '
+            'refreshed_at, created_at) VALUES (:user_id, :ig_user_id, :username, :access_token, '
+            ':expires_at, :refreshed_at, :created_at)',
+            account
+        )
+        db.commit()
+    return account, None
+
+def unlink_account(user_id):
+    with db_lock:
+        cursor = db.execute('DELETE FROM accounts WHERE user_id = ?', (user_id,))
+        db.commit()
+    return cursor.rowcount > 0
+
+def refresh_account_token(account):
+    try:
+        result = graph_session.get(
+            f'{GRAPH_API_URL}/refresh_access_token',
+            params={'grant_type': 'ig_refresh_token', 'access_token': account['access_token']},
+            timeout=GRAPH_TIMEOUTS['media']
+        ).json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        result = {'error': {'message': type(e).__name__}}
+    if 'access_token' not in result:
+        inc_counter('nexabot_token_refresh_total', result='error')
+        log(f"⚠️ Token yenilenemedi ({account['username']}): {result.get('error', {}).get('message')}")
+        return
+    
+    now = time.time()
+    with db_lock:
+        db.execute(
+            'UPDATE accounts SET access_token = ?, expires_at = ?, refreshed_at = ? WHERE user_id = ?',
+            (result['access_token'], now + result.get('expires_in', TOKEN_LIFETIME), now, account['user_id'])
+        )
+        db.commit()
+    inc_counter('nexabot_token_refresh_total', result='ok')
+    log(f"🔑 Token yenilendi: {account['username']}")
+
+def token_refresher():
+    while True:
+        try:
+            now = time.time()
+            # Instagram 24 saatten yeni token'ları yenilemez
+            with db_lock:
+                rows = db.execute(
+                    'SELECT * FROM accounts WHERE expires_at < ? AND refreshed_at < ?',
+                    (now + TOKEN_REFRESH_MARGIN, now - 86400)
+                ).fetchall()
+            for row in rows:
+                # Bir hesabın hatası diğerlerini bir saat bekletmesin
+                try:
+                    refresh_account_token(dict(row))
+                except Exception as e:
+                    inc_counter('nexabot_token_refresh_total', result='error')
+                    log(f"❌ Token yenileme hatası ({row['username']}): {e}")
+        except Exception as e:
+            log(f"❌ Token refresher error: {e}")
+        if stop_event.wait(3600):
+            return
+
+# METRICS - Prometheus text formatında /metrics için
+HISTOGRAM_BUCKETS = {
+    'nexabot_publish_duration_seconds': (5, 15, 30, 60, 120, 300, 600),
+    'nexabot_publish_delay_seconds': (1, 5, 15, 30, 60, 300, 900),
+    'nexabot_cloudinary_upload_seconds': (0.5, 1, 2, 5, 10, 30, 60, 120),
+    'nexabot_stage_duration_seconds': (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+}
+
+metrics_lock = threading.Lock()
+metric_counters = Counter()  # (isim, etiketler) -> değer
+metric_histograms = {}  # (isim, etiketler) -> [bucket sayıları, toplam, adet]
+
+def inc_counter(name, amount=1, **labels):
+    with metrics_lock:
+        metric_counters[(name, tuple(sorted(labels.items())))] += amount
+
+def observe(name, value, **labels):
+    buckets = HISTOGRAM_BUCKETS[name]
+    key = (name, tuple(sorted(labels.items())))
+    with metrics_lock:
+        histogram = metric_histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def render_metrics(gauges):
+    lines = []
+    typed = set()
+    
+    def declare(name, kind):
+        # Aynı metriğin satırları art arda gelir; # TYPE ilk satırdan önce bir kez yazılır
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+    
+    with metrics_lock:
+        for name, value in sorted(gauges.items()):
+            declare(name.split('{')[0], 'gauge')
+            lines.append(f'{name} {value}')
+        
+        for (name, labels), value in sorted(metric_counters.items()):
+            declare(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {value}')
+        
+        for (name, labels), (counts, total, count) in sorted(metric_histograms.items()):
+            declare(name, 'histogram')
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS[name], counts):
+                bucket_labels = labels + (('le', bound),)
+                lines.append(f'{name}_bucket{format_labels(bucket_labels)} {bucket_count}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    
+    return '\n'.join(lines) + '\n'
+
+# TRACING - medya ve gönderi başına aşama süreleri
+# Aşamalar: ingest_wait, telegram_get_file, telegram_download, photo_resize, cloudinary_upload (medya);
+# queue_wait, container_create, container_wait, publish (gönderi).
+def log_event(event, **fields):
+    """LOG_FORMAT=json ise tek satır JSON, değilse okunabilir bir satır yazar."""
+    if LOG_FORMAT == 'json':
+        record = {'ts': datetime.now().isoformat(), 'event': event}
+        record.update(fields)
+        print(json.dumps(record, default=str), file=sys.stdout, flush=True)
+    else:
+        details = ' '.join(f'{key}={value}' for key, value in fields.items())
+        log(f"⏱️ {event} {details}")
+
+def record_span(target, stage, duration, **fields):
+    """Aşama süresini hedefin (gönderi ya da oturum) 'spans' alanına ekler.
+    
+    Tekrar denemelerde aynı aşama birden fazla çalışabilir; süreler toplanır.
+    """
+    spans = target.setdefault('spans', {})
+    spans[stage] = round(spans.get(stage, 0) + duration, 3)
+    observe('nexabot_stage_duration_seconds', duration, stage=stage)
+    log_event('span', stage=stage, duration=round(duration, 3), **fields)
+
+@contextmanager
+def span(target, stage, **fields):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(target, stage, time.perf_counter() - started, **fields)
+
+# Örnekleyici profiler: PROFILE_INTERVAL > 0 ise thread stack'leri periyodik
+# olarak toplanır, /debug/profile collapsed formatta (flamegraph.pl, speedscope) döner.
+profile_samples = Counter()  # 'thread;çerçeve;...;çerçeve' -> örnek sayısı
+profile_lock = threading.Lock()
+# Lock/condition/kuyruk ve select beklemesindeki thread'ler boşta sayılır
+PROFILE_IDLE_FILES = {threading.__file__, queue.__file__, selectors.__file__}
+# Sadece getUpdates long polling'ini bekleyen thread'ler (telebot bunu kendi
+# PollingThread'inde yapar); socket okumaları iş değil
+PROFILE_IDLE_THREADS = {'bot', 'PollingThread'}
+
+def is_idle_frame(frame):
+    """En üstteki çerçeve bir bekleme mi (kuyruk, select ya da stop_event beklemesi)?"""
+    return frame.f_code.co_filename in PROFILE_IDLE_FILES
+
+def sampling_profiler():
+    own_ident = threading.get_ident()
+    while not stop_event.wait(PROFILE_INTERVAL):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            # publish-0, publish-1 ... tek satırda toplansın
+            thread_name = names.get(ident, 'unknown').rstrip('0123456789').rstrip('-')
+            # Boşta bekleyen thread'ler sayılmaz, yoksa asıl sıcak yolu gömerler
+            if ident == own_ident or thread_name in PROFILE_IDLE_THREADS or is_idle_frame(frame):
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+                frame = frame.f_back
+            stacks.append(';'.join([thread_name] + frames[::-1]))
+        
+        with profile_lock:
+            profile_samples.update(stacks)
+
+# MEDIA CACHE
+# Aynı medya tekrar gönderildiğinde Cloudinary'e yeniden yüklememek için.
+# Anahtarlar 'file:<telegram file_unique_id>' ve 'sha256:<içerik hash'i>'.
+media_cache = OrderedDict()
+media_cache_lock = threading.Lock()
+
+def cache_get(key):
+    with media_cache_lock:
+        if key in media_cache:
+            media_cache.move_to_end(key)
+            return media_cache[key]
+    
+    if not MEDIA_CACHE_PERSIST:
+        return None
+    
+    with db_lock:
+        row = db.execute('SELECT data FROM media_cache WHERE cache_key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    
+    entry = json.loads(row['data'])
+    cache_put(key, entry, persist=False)
+    return entry
+
+def cache_put(key, entry, persist=True):
+    with media_cache_lock:
+        media_cache[key] = entry
+        media_cache.move_to_end(key)
+        while len(media_cache) > MEDIA_CACHE_SIZE:
+            media_cache.popitem(last=False)
+    
+    if persist and MEDIA_CACHE_PERSIST:
+        with db_lock:
+            db.execute(
+                'INSERT OR REPLACE INTO media_cache (cache_key, public_id, data, created_at) VALUES (?, ?, ?, ?)',
+                (key, entry['public_id'], json.dumps(entry), datetime.now().isoformat())
+            )
+            db.commit()
+
+def forget_media(public_ids):
+    """Cloudinary'den silinen asset'lere işaret eden cache kayıtlarını tek geçişte kaldırır."""
+    public_ids = set(public_ids)
+    with media_cache_lock:
+        for key in [key for key, entry in media_cache.items() if entry['public_id'] in public_ids]:
+            del media_cache[key]
+    
+    if MEDIA_CACHE_PERSIST and public_ids:
+        placeholders = ', '.join('?' * len(public_ids))
+        with db_lock:
+            db.execute(f'DELETE FROM media_cache WHERE public_id IN ({placeholders})', tuple(public_ids))
+            db.commit()
+
+def media_cache_stats():
+    hits = sum(metric_counters[('nexabot_media_cache_total', (('result', result),))]
+               for result in ('hit_file', 'hit_content'))
+    misses = metric_counters[('nexabot_media_cache_total', (('result', 'miss'),))]
+    return {
+        'size': len(media_cache),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0
+    }
+
+# SESSIONS
+# Boşta kalan oturumlar SESSION_IDLE_TTL sonra, SESSION_MAX aşılınca da en eskisi
+# atılır. Atılan oturumda yüklenmiş ama paylaşılmamış medya varsa Cloudinary'den silinir.
+sessions_lock = threading.RLock()
+def media_assets(item):
+    """Oturum veya gönderinin Cloudinary asset'leri: [(public_id, resource_type)]."""
+    assets = []
+    if item.get('public_id'):
+        assets.append((item['public_id'], item['media_type']))
+    for child in item.get('children') or []:
+        if child.get('public_id'):
+            assets.append((child['public_id'], child['media_type']))
+    return assets
+
+def get_session(user_id):
+    with sessions_lock:
+        session = user_sessions.get(user_id)
+        if session is not None:
+            session['last_active'] = time.time()
+            user_sessions.move_to_end(user_id)
+        return session
+
+def set_session(user_id, session):
+    with sessions_lock:
+        previous = user_sessions.get(user_id)
+        session['last_active'] = time.time()
+        user_sessions[user_id] = session
+        user_sessions.move_to_end(user_id)
+        
+        evicted = []
+        while len(user_sessions) > SESSION_MAX:
+            evicted.append(user_sessions.popitem(last=False))
+    
+    save_session(user_id)
+    
+    # Yerine yenisi konan oturumun medyası artık sahipsiz (ör. /cancel)
+    if previous is not None and previous is not session:
+        kept = {public_id for public_id, _ in media_assets(session)}
+        orphaned = [asset for asset in media_assets(previous) if asset[0] not in kept]
+        if orphaned:
+            schedule_asset_cleanup(orphaned, 'abandoned')
+    
+    for evicted_user_id, evicted_session in evicted:
+        expire_session(evicted_user_id, evicted_session, 'evicted')
+
+def save_session(user_id):
+    with sessions_lock:
+        session = user_sessions.get(user_id)
+        if session is None:
+            return
+        data = json.dumps(session, default=str)
+    db_write_queue.put(('session', user_id, data))
+
+def expire_session(user_id, session, reason):
+    db_write_queue.put(('session', user_id, None))
+    schedule_asset_cleanup(media_assets(session), 'abandoned')
+    inc_counter('nexabot_sessions_expired_total', reason=reason)
+
+def expire_idle_sessions():
+    cutoff = time.time() - SESSION_IDLE_TTL
+    expired = []
+    with sessions_lock:
+        while user_sessions:
+            user_id, session = next(iter(user_sessions.items()))
+            if session.get('last_active', 0) >= cutoff:
+                break
+            user_sessions.popitem(last=False)
+            expired.append((user_id, session))
+    
+    for user_id, session in expired:
+        expire_session(user_id, session, 'idle')
+    if expired:
+        log(f"🧹 {len(expired)} boşta oturum temizlendi")
+
+def session_sweeper():
+    while True:
+        try:
+            expire_idle_sessions()
+        except Exception as e:
+            log(f"❌ Session sweeper error: {e}")
+        if stop_event.wait(60):
+            return
+
+# ASSET CLEANUP
+# Instagram'ın aldığı (gönderi paylaşıldı/başarısız) ya da sahipsiz kalan (oturum
+# bitti, /cancel, albüm fazlası, aynı içerik) asset'ler asset_cleanup tablosuna
+# yazılır. asset_collector bekleme süresi dolanları delete_resources ile toplu siler.
+ASSET_DELETE_BATCH = 100  # delete_resources'ın tek çağrıda kabul ettiği en fazla id
+ASSET_MAX_ATTEMPTS = 5
+asset_delete_bucket = TokenBucket(ASSET_DELETE_RATE_PER_HOUR / 3600, 5)
+
+def schedule_asset_cleanup(assets, reason, grace=None):
+    delete_after = time.time() + (ASSET_CLEANUP_GRACE if grace is None else grace)
+    for public_id, resource_type in assets:
+        db_write_queue.put(('asset', public_id, (resource_type, reason, delete_after)))
+
+def assets_in_use():
+    """Bekleyen/işlenen gönderilerin ve açık oturumların kullandığı public_id'ler.
+    
+    Cache sayesinde aynı asset silinmek üzereyken yeni bir gönderide kullanılabilir.
+    """
+    with index_lock:
+        in_use = set(active_assets)
+    with sessions_lock:
+        for session in user_sessions.values():
+            in_use.update(public_id for public_id, _ in media_assets(session))
+    return in_use
+
+def delete_asset_batch(resource_type, public_ids):
+    """Asset'leri tek çağrıda siler; işi biten (silinmiş ya da zaten olmayan) id'leri döner."""
+    # Silinen asset cache'ten tekrar verilmesin
+    forget_media(public_ids)
+    
+    result = cloudinary.api.delete_resources(public_ids, resource_type=resource_type)
+    return {
+        public_id for public_id, state in result.get('deleted', {}).items()
+        if state in ('deleted', 'not_found')
+    }
+
+def collect_assets():
+    """Zamanı gelen asset'leri siler; bir sonraki tura kadar beklenecek süreyi döner."""
+    now = time.time()
+    with db_lock:
+        rows = db.execute(
+            'SELECT public_id, resource_type, attempts FROM asset_cleanup '
+            'WHERE delete_after <= ? ORDER BY delete_after LIMIT 1000',
+            (now,)
+        ).fetchall()
+    if not rows:
+        return 60
+    
+    # Kullanımdaki asset'lerin kaydı silinir; onları kullanan gönderi/oturum bitince tekrar yazılır
+    in_use = assets_in_use()
+    done = {row['public_id'] for row in rows if row['public_id'] in in_use}
+    by_type = {}
+    for row in rows:
+        if row['public_id'] not in in_use:
+            by_type.setdefault(row['resource_type'], []).append(row['public_id'])
+    
+    wait = 60
+    attempted = set()
+    for resource_type, public_ids in by_type.items():
+        for start in range(0, len(public_ids), ASSET_DELETE_BATCH):
+            batch = public_ids[start:start + ASSET_DELETE_BATCH]
+            asset_delete_bucket.acquire()
+            attempted.update(batch)
+            try:
+                deleted = delete_asset_batch(resource_type, batch)
+                done.update(deleted)
+                inc_counter('nexabot_asset_cleanup_total', len(deleted), result='deleted')
+            except cloudinary.exceptions.RateLimited as e:
+                log(f"⚠️ Cloudinary silme limiti doldu: {e}")
+                attempted.difference_update(batch)
+                wait = 900
+                break
+            except Exception as e:
+                inc_counter('nexabot_asset_cleanup_total', len(batch), result='error')
+                log(f"⚠️ Medya silinemedi ({resource_type}, {len(batch)} adet): {e}")
+        if wait != 60:
+            break
+    
+    # Silinemeyenler artan aralıklarla tekrar denenir, sonunda bırakılır
+    retries = []
+    for row in rows:
+        if row['public_id'] in attempted and row['public_id'] not in done:
+            if row['attempts'] + 1 >= ASSET_MAX_ATTEMPTS:
+                done.add(row['public_id'])
+                inc_counter('nexabot_asset_cleanup_total', result='abandoned')
+            else:
+                delay = min(300 * 2 ** row['attempts'], 86400)
+                retries.append((now + delay, row['public_id']))
+    
+    with db_lock:
+        db.executemany('DELETE FROM asset_cleanup WHERE public_id = ?', [(public_id,) for public_id in done])
+        db.executemany(
+            'UPDATE asset_cleanup SET attempts = attempts + 1, delete_after = ? WHERE public_id = ?', retries
+        )
+        db.commit()
+    
+    if done:
+        log(f"🗑️ {len(done)} Cloudinary asset'i temizlendi")
+    # Birikmiş iş varsa beklemeden devam et
+    return 0 if wait == 60 and len(rows) == 1000 else wait
+
+def asset_collector():
+    while True:
+        try:
+            wait = collect_assets()
+        except Exception as e:
+            log(f"❌ Asset collector error: {e}")
+            wait = 60
+        if stop_event.wait(wait):
+            return
 
 app = Flask(__name__)
 
@@ -48,9 +1381,9 @@ app = Flask(__name__)
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
     user_id = message.from_user.id
-    user_sessions[user_id] = {'state': 'ready'}
+    set_session(user_id, {'state': 'ready'})
     
-    print(f"🎯 /start komutu alındı: {user_id}")
+    log(f"🎯 /start komutu alındı: {user_id}")
     
     welcome_text = """
 🚀 *Nexabot - Instagram Otomatik Paylaşım* 🤖
@@ -66,13 +1399,15 @@ def send_welcome(message):
 3. Zaman seç
 4. Tamam! Otomatik paylaşılacak 🎉
 
+🖼️ Birden fazla medyayı albüm olarak gönderirsen carousel olarak paylaşılır.
+
 *Not:* Video paylaşımları biraz daha uzun sürebilir.
 """
     bot.reply_to(message, welcome_text, parse_mode='Markdown')
 
 @bot.message_handler(commands=['help'])
 def send_help(message):
-    print(f"🎯 /help komutu alındı: {message.from_user.id}")
+    log(f"🎯 /help komutu alındı: {message.from_user.id}")
     
     help_text = """
 🤖 *Nexabot - Yardım*
@@ -90,109 +1425,244 @@ def send_help(message):
 *Komutlar:*
 /start - Botu başlat
 /help - Yardım
-/posts - Gönderileri gör
+/posts - Gönderileri gör (`/posts bekleyen`, `paylaşılan`, `hatalı`)
+/link - Instagram hesabını bağla
+/unlink - Hesap bağlantısını kaldır
 /cancel - İptal et
 """
     bot.reply_to(message, help_text, parse_mode='Markdown')
 
+POST_FILTERS = {
+    'all': 'Tümü',
+    'pending': '⏳ Bekleyen',
+    'completed': '✅ Paylaşılan',
+    'failed': '❌ Hatalı'
+}
+
+# /posts argümanı için Türkçe karşılıklar
+POST_FILTER_ALIASES = {
+    'tümü': 'all',
+    'bekleyen': 'pending',
+    'paylaşılan': 'completed',
+    'hatalı': 'failed'
+}
+
+def render_posts_page(user_id, status, page):
+    posts, total = user_posts_page(user_id, status, page)
+    
+    if not total:
+        text = "📭 Henüz zamanlanmış gönderin yok!" if status == 'all' else "📭 Bu filtrede gönderi yok."
+    else:
+        page_count = (total + POSTS_PAGE_SIZE - 1) // POSTS_PAGE_SIZE
+        text = f"📋 *Zamanlanmış Gönderilerin:* ({POST_FILTERS[status]}, sayfa {page + 1}/{page_count})\n\n"
+        for post in posts:
+            status_emoji = {
+                'pending': '⏳',
+                'processing': '🔄', 
+                'completed': '✅',
+                'failed': '❌'
+            }.get(post['status'], '❓')
+            
+            media_emoji = {'video': '🎥', 'carousel': '🖼️'}.get(post.get('media_type'), '📸')
+            time_str = datetime.fromisoformat(post['scheduled_time']).strftime('%d.%m.%Y %H:%M')
+            text += f"{media_emoji} {status_emoji} *{time_str}*\n"
+            # Önce kısalt, sonra kaçır; kesilen bir kaçış işareti Markdown'ı bozmasın
+            text += f"📝 {escape_markdown(post['caption'][:30])}...\n"
+            
+            if post.get('error_message'):
+                text += f"❌ {escape_markdown(post['error_message'][:50])}\n"
+            text += "━━━━━━━━━━━━━━━━━━━━\n"
+    
+    markup = types.InlineKeyboardMarkup()
+    markup.row(*[
+        types.InlineKeyboardButton(label, callback_data=f"posts:{key}:0")
+        for key, label in POST_FILTERS.items()
+    ])
+    
+    nav = []
+    if page > 0:
+        nav.append(types.InlineKeyboardButton("◀️ Önceki", callback_data=f"posts:{status}:{page - 1}"))
+    if (page + 1) * POSTS_PAGE_SIZE < total:
+        nav.append(types.InlineKeyboardButton("Sonraki ▶️", callback_data=f"posts:{status}:{page + 1}"))
+    if nav:
+        markup.row(*nav)
+    
+    return text, markup
+
 @bot.message_handler(commands=['posts'])
 def show_posts(message):
     user_id = message.from_user.id
-    print(f"🎯 /posts komutu alındı: {user_id}")
+    log(f"🎯 /posts komutu alındı: {user_id}")
     
-    user_posts = [p for p in scheduled_posts if p.get('user_id') == user_id]
-    
-    if not user_posts:
-        bot.reply_to(message, "📭 Henüz zamanlanmış gönderin yok!")
+    args = message.text.split()[1:]
+    status = args[0].lower() if args else 'all'
+    status = POST_FILTER_ALIASES.get(status, status)
+    if status not in POST_FILTERS:
+        bot.reply_to(message, "❌ Geçersiz filtre! Örnek: `/posts bekleyen`", parse_mode='Markdown')
         return
     
-    response = "📋 *Zamanlanmış Gönderilerin:*\n\n"
-    for post in user_posts[:5]:
-        status_emoji = {
-            'pending': '⏳',
-            'processing': '🔄', 
-            'completed': '✅',
-            'failed': '❌'
-        }.get(post['status'], '❓')
-        
-        media_emoji = '🎥' if post.get('media_type') == 'video' else '📸'
-        time_str = datetime.fromisoformat(post['scheduled_time']).strftime('%d.%m.%Y %H:%M')
-        response += f"{media_emoji} {status_emoji} *{time_str}*\n"
-        response += f"📝 {post['caption'][:30]}...\n"
+    text, markup = render_posts_page(user_id, status, 0)
+    bot.reply_to(message, text, parse_mode='Markdown', reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('posts:'))
+def page_posts(call):
+    try:
+        _, status, page = call.data.split(':')
+        if status not in POST_FILTERS:
+            status = 'all'
         
-        if post.get('error_message'):
-            response += f"❌ {post['error_message'][:50]}\n"
-        response += "━━━━━━━━━━━━━━━━━━━━\n"
-    
-    bot.reply_to(message, response, parse_mode='Markdown')
+        text, markup = render_posts_page(call.from_user.id, status, max(int(page), 0))
+        bot.edit_message_text(
+            text,
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode='Markdown',
+            reply_markup=markup
+        )
+    except telebot.apihelper.ApiTelegramException as e:
+        # Aynı sayfaya tekrar basılınca "message is not modified" döner
+        log(f"⚠️ /posts sayfa hatası: {e}")
+    finally:
+        bot.answer_callback_query(call.id)
 
 @bot.message_handler(commands=['cancel'])
 def cancel_operation(message):
     user_id = message.from_user.id
-    print(f"🎯 /cancel komutu alındı: {user_id}")
+    log(f"🎯 /cancel komutu alındı: {user_id}")
     
-    if user_id in user_sessions:
-        user_sessions[user_id] = {'state': 'ready'}
+    if get_session(user_id) is not None:
+        set_session(user_id, {'state': 'ready'})
         bot.reply_to(message, "❌ İşlem iptal edildi.")
 
+@bot.message_handler(commands=['link'])
+def link_command(message):
+    user_id = message.from_user.id
+    log(f"🎯 /link komutu alındı: {user_id}")
+    
+    args = message.text.split()[1:]
+    if not args:
+        linked = get_linked_account(user_id)
+        current = f"🔗 Bağlı hesap: @{escape_markdown(linked['username'] or '')}\n\n" if linked else ""
+        bot.reply_to(
+            message,
+            f"{current}Instagram hesabını bağlamak için uzun ömürlü access token'ını gönder:\n"
+            "`/link <token>`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    # Token sohbet geçmişinde kalmasın
+    try:
+        bot.delete_message(message.chat.id, message.message_id)
+    except Exception as e:
+        log(f"⚠️ /link mesajı silinemedi: {e}")
+    
+    try:
+        account, error = link_account(user_id, args[0])
+    except Exception as e:
+        log(f"❌ /link hatası ({user_id}): {e}")
+        account, error = None, 'Beklenmeyen bir hata oluştu, tekrar deneyin'
+    if error:
+        send_message(user_id, f"❌ Hesap bağlanamadı: {error}")
+        return
+    send_message(user_id, f"✅ Instagram hesabı bağlandı: @{account['username']}\nYeni gönderiler bu hesapta paylaşılacak.")
+
+@bot.message_handler(commands=['unlink'])
+def unlink_command(message):
+    user_id = message.from_user.id
+    log(f"🎯 /unlink komutu alındı: {user_id}")
+    
+    if unlink_account(user_id):
+        bot.reply_to(message, "🔓 Instagram hesabının bağlantısı kaldırıldı. Bekleyen gönderileri paylaşılamayacak.")
+    else:
+        bot.reply_to(message, "ℹ️ Bağlı bir Instagram hesabın yok.")
+
 @bot.message_handler(content_types=['photo', 'video'])
 def handle_media(message):
     try:
         user_id = message.from_user.id
         telegram_media_type = 'video' if message.video else 'photo'
         
-        print(f"📸 MEDYA ALINDI: {telegram_media_type} from {user_id}")
-        
-        # Hemen cevap ver
-        bot.reply_to(message, f"📥 {telegram_media_type} alındı! İşleniyor...")
+        log(f"📸 MEDYA ALINDI: {telegram_media_type} from {user_id}")
         
         # Video süre kontrolü
         if telegram_media_type == 'video' and message.video.duration > 60:
             bot.reply_to(message, "❌ Video 60 saniyeden uzun olamaz! Lütfen daha kısa video gönderin.")
             return
         
-        if telegram_media_type == 'photo':
-            photo = message.photo[-1]
-            file_info = bot.get_file(photo.file_id)
-            downloaded_file = bot.download_file(file_info.file_path)
-            
-            upload_result = cloudinary.uploader.upload(
-                downloaded_file,
-                resource_type='image',
-                folder='telegram_instagram'
-            )
-            instagram_media_type = 'image'
-            
-        else:  # video
-            video = message.video
-            file_info = bot.get_file(video.file_id)
-            downloaded_file = bot.download_file(file_info.file_path)
-            
-            # Video boyut kontrolü
-            if len(downloaded_file) > 100 * 1024 * 1024:  # 100MB
-                bot.reply_to(message, "❌ Video 100MB'den büyük olamaz!")
-                return
-            
-            upload_result = cloudinary.uploader.upload(
-                downloaded_file,
-                resource_type='video',
-                folder='telegram_instagram',
-                chunk_size=6000000
-            )
-            instagram_media_type = 'video'
+        job = {
+            'message': message,
+            'user_id': user_id,
+            'media_type': telegram_media_type,
+            'media_group_id': message.media_group_id,
+            'enqueued_at': time.time()
+        }
+        
+        first_in_group = add_group_item(message) if message.media_group_id else True
+        
+        with ingest_lock:
+            position = ingest_queue.qsize() + ingest_active + 1
+            try:
+                ingest_queue.put_nowait(job)
+            except queue.Full:
+                position = None
+        
+        if position is None:
+            log(f"⚠️ Ingest kuyruğu dolu, {user_id} reddedildi")
+            if message.media_group_id:
+                drop_group_item(message)
+            bot.reply_to(message, "⏳ Sistem şu an çok yoğun, lütfen birkaç dakika sonra tekrar gönder.")
+            return
+        
+        # Hemen cevap ver - albümde sadece ilk medya için
+        if message.media_group_id:
+            if first_in_group:
+                bot.reply_to(message, f"📥 Albüm alındı! Sıraya alındı (sıra: {position})...")
+        else:
+            bot.reply_to(message, f"📥 {telegram_media_type} alındı! Sıraya alındı (sıra: {position})...")
+        
+    except Exception as e:
+        log(f"❌ MEDYA HATASI: {str(e)}")
+        bot.reply_to(message, f"❌ Medya işleme hatası: {str(e)}")
+
+def process_media_job(job):
+    message = job['message']
+    user_id = job['user_id']
+    telegram_media_type = job['media_type']
+    media_group_id = job.get('media_group_id')
+    upload_result = None
+    trace = {}
+    record_span(trace, 'ingest_wait', time.time() - job['enqueued_at'], user_id=user_id, message_id=message.message_id)
+    
+    if telegram_media_type == 'photo':
+        media = message.photo[-1]
+        resource_type = 'image'
+        instagram_media_type = 'image'
+    else:  # video
+        media = message.video
+        resource_type = 'video'
+        instagram_media_type = 'video'
+    
+    try:
+        upload_result = ingest_media(message, media, resource_type, trace)
+        if upload_result is None or media_group_id:
+            return
         
-        user_sessions[user_id] = {
+        # Aşama süreleri oturumla birlikte gönderiye taşınır
+        set_session(user_id, {
             'state': 'waiting_caption',
             'media_url': upload_result['secure_url'],
             'media_type': instagram_media_type,
             'public_id': upload_result.get('public_id'),
-            'duration': upload_result.get('duration', 0)
-        }
+            'duration': upload_result.get('duration', 0),
+            'spans': trace.get('spans', {})
+        })
         
-        print(f"✅ Cloudinary yükleme başarılı: {upload_result['secure_url']}")
+        log(f"✅ Cloudinary yükleme başarılı: {upload_result['secure_url']}")
         
+        throttle_telegram(user_id)
         if telegram_media_type == 'photo':
-            bot.send_photo(user_id, downloaded_file, 
+            bot.send_photo(user_id, media.file_id, 
                           caption="📸 *Fotoğraf hazır!* Açıklama yaz:",
                           parse_mode='Markdown')
         else:
@@ -201,8 +1671,350 @@ def handle_media(message):
                            parse_mode='Markdown')
                       
     except Exception as e:
-        print(f"❌ MEDYA HATASI: {str(e)}")
+        log(f"❌ MEDYA HATASI: {str(e)}")
         bot.reply_to(message, f"❌ Medya işleme hatası: {str(e)}")
+    
+    finally:
+        if media_group_id:
+            finish_group_item(media_group_id, message.message_id, upload_result, instagram_media_type)
+
+def add_group_item(message):
+    """Albüm mesajını gruba ekler; grubun ilk mesajıysa True döner.
+    
+    Her yeni mesaj bekleme süresini baştan başlatır, MEDIA_GROUP_WAIT boyunca
+    yeni mesaj gelmezse albüm tamamlanmış sayılır.
+    """
+    group_id = message.media_group_id
+    with media_groups_lock:
+        group = media_groups.get(group_id)
+        first = group is None
+        if first:
+            group = media_groups[group_id] = {
+                'user_id': message.from_user.id,
+                'items': {},
+                'closed': False,
+                'timer': None
+            }
+        
+        group['items'][message.message_id] = None
+        if group['timer']:
+            group['timer'].cancel()
+        group['timer'] = threading.Timer(MEDIA_GROUP_WAIT, close_group, args=(group_id,))
+        group['timer'].daemon = True
+        group['timer'].start()
+    
+    return first
+
+def drop_group_item(message):
+    with media_groups_lock:
+        group = media_groups.get(message.media_group_id)
+        if group:
+            group['items'].pop(message.message_id, None)
+    finalize_group(message.media_group_id)
+
+def close_group(group_id):
+    with media_groups_lock:
+        group = media_groups.get(group_id)
+        if group:
+            group['closed'] = True
+    finalize_group(group_id)
+
+def finish_group_item(group_id, message_id, upload_result, media_type):
+    with media_groups_lock:
+        group = media_groups.get(group_id)
+        if not group:
+            return
+        # None: hâlâ yükleniyor, False: yüklenemedi
+        group['items'][message_id] = dict(upload_result, media_type=media_type) if upload_result else False
+    finalize_group(group_id)
+
+def finalize_group(group_id):
+    """Albüm kapandıysa ve bütün medyalar yüklendiyse kullanıcı oturumunu hazırlar."""
+    with media_groups_lock:
+        group = media_groups.get(group_id)
+        if not group or not group['closed'] or any(item is None for item in group['items'].values()):
+            return
+        del media_groups[group_id]
+    
+    user_id = group['user_id']
+    items = [group['items'][message_id] for message_id in sorted(group['items'])]
+    children = [
+        {
+            'media_url': item['secure_url'],
+            'media_type': item['media_type'],
+            'public_id': item.get('public_id')
+        }
+        for item in items if item
+    ]
+    failed_count = sum(1 for item in items if item is False)
+    
+    # Instagram en fazla MAX_CAROUSEL_ITEMS kabul eder; fazlası hiç kullanılmayacak
+    schedule_asset_cleanup(
+        [(child['public_id'], child['media_type']) for child in children[MAX_CAROUSEL_ITEMS:] if child['public_id']],
+        'abandoned'
+    )
+    children = children[:MAX_CAROUSEL_ITEMS]
+    
+    if not children:
+        send_message(user_id, "❌ Albümdeki medyalar yüklenemedi.")
+        return
+    
+    if len(children) == 1:
+        child = children[0]
+        set_session(user_id, {
+            'state': 'waiting_caption',
+            'media_url': child['media_url'],
+            'media_type': child['media_type'],
+            'public_id': child['public_id'],
+            'duration': 0
+        })
+        text = f"{'🎥' if child['media_type'] == 'video' else '📸'} *{media_label(child['media_type'])} hazır!* Açıklama yaz:"
+    else:
+        set_session(user_id, {
+            'state': 'waiting_caption',
+            'media_url': children[0]['media_url'],
+            'media_type': 'carousel',
+            'public_id': None,
+            'children': children
+        })
+        text = f"🖼️ *Albüm hazır!* ({len(children)} medya)\nAçıklama yaz:"
+    
+    if failed_count:
+        text += f"\n⚠️ {failed_count} medya yüklenemedi, albümden çıkarıldı."
+    
+    log(f"✅ Albüm {group_id} hazır: {len(children)} medya")
+    send_message(user_id, text, parse_mode='Markdown')
+
+def ingest_media(message, media, resource_type, trace):
+    """Medyayı Cloudinary'e yükler; daha önce yüklenmişse cache'teki sonucu döner.
+    
+    İndirme ve yükleme süreleri trace['spans'] içine yazılır.
+    """
+    file_key = f'file:{media.file_unique_id}'
+    cached = cache_get(file_key)
+    if cached:
+        inc_counter('nexabot_media_cache_total', result='hit_file')
+        log(f"♻️ Medya cache'te bulundu: {cached['public_id']}")
+        return cached
+    
+    fields = {'user_id': message.from_user.id, 'message_id': message.message_id}
+    with span(trace, 'telegram_get_file', **fields):
+        file_info = bot.get_file(media.file_id)
+    file_size = file_info.file_size or media.file_size
+    
+    # Boyut kontrolü - indirmeden önce
+    if not file_size:
+        bot.reply_to(message, "❌ Dosya boyutu alınamadı, lütfen tekrar gönderin.")
+        return None
+    if file_size > MAX_VIDEO_SIZE:
+        bot.reply_to(message, "❌ Video 100MB'den büyük olamaz!")
+        return None
+    
+    if resource_type == 'image' and Image is not None:
+        upload_result, content_hash = upload_photo(file_info.file_path, file_size, trace, **fields)
+    else:
+        upload_result, content_hash = stream_to_cloudinary(
+            file_info.file_path, file_size, resource_type, trace, **fields
+        )
+    entry = {
+        'secure_url': upload_result['secure_url'],
+        'public_id': upload_result.get('public_id'),
+        'duration': upload_result.get('duration', 0),
+        'resource_type': resource_type
+    }
+    
+    content_key = f'sha256:{content_hash}'
+    cached = cache_get(content_key)
+    if cached:
+        # Aynı içerik farklı bir Telegram dosyası olarak gelmiş; yeni kopyayı sil
+        inc_counter('nexabot_media_cache_total', result='hit_content')
+        log(f"♻️ Aynı içerik zaten yüklü: {cached['public_id']}")
+        schedule_asset_cleanup([(entry['public_id'], resource_type)], 'duplicate', grace=0)
+        cache_put(file_key, cached)
+        return cached
+    
+    inc_counter('nexabot_media_cache_total', result='miss')
+    cache_put(file_key, entry)
+    cache_put(content_key, entry)
+    return entry
+
+def ingest_worker():
+    global ingest_active
+    
+    while True:
+        job = ingest_queue.get()
+        with ingest_lock:
+            ingest_active += 1
+        started = time.time()
+        
+        try:
+            process_media_job(job)
+        except Exception as e:
+            log(f"❌ Ingest worker error: {e}")
+        finally:
+            finished = time.time()
+            ingest_latencies.append((started - job['enqueued_at'], finished - job['enqueued_at']))
+            with ingest_lock:
+                ingest_active -= 1
+            ingest_queue.task_done()
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+def ingest_stats():
+    waits = [wait for wait, _ in ingest_latencies]
+    totals = [total for _, total in ingest_latencies]
+    return {
+        'queue_depth': ingest_queue.qsize(),
+        'active': ingest_active,
+        'workers': INGEST_WORKERS,
+        'wait_p50': round(percentile(waits, 50), 2),
+        'latency_p50': round(percentile(totals, 50), 2),
+        'latency_p95': round(percentile(totals, 95), 2)
+    }
+
+class TelegramFileStream:
+    """Telegram dosyasını parça parça okuyan file-like nesne.
+    
+    cloudinary.uploader.upload_large her chunk için read() çağırır, böylece
+    bellekte aynı anda sadece bir chunk tutulur.
+    """
+    
+    def __init__(self, file_path, file_size):
+        self.name = os.path.basename(file_path)
+        self.size = file_size
+        self.position = 0
+        self.at_end = False
+        self.read_seconds = 0.0  # Telegram'dan okumada geçen süre
+        self.sha256 = hashlib.sha256()
+        url = TELEGRAM_FILE_URL.format(TELEGRAM_TOKEN, file_path)
+        self.response = telegram_session.get(url, stream=True, timeout=(5, 60))
+        self.response.raise_for_status()
+    
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        
+        parts = []
+        remaining = size
+        started = time.perf_counter()
+        while remaining > 0:
+            data = self.response.raw.read(remaining, decode_content=True)
+            if not data:
+                break
+            parts.append(data)
+            remaining -= len(data)
+        self.read_seconds += time.perf_counter() - started
+        
+        chunk = b''.join(parts)
+        self.position += len(chunk)
+        self.sha256.update(chunk)
+        if self.position > self.size:
+            raise ValueError("Dosya bildirilen boyuttan büyük")
+        return chunk
+    
+    # upload_large dosya boyutunu seek(0, SEEK_END) + tell() ile öğrenir,
+    # sonra eski konuma geri döner; gerçek bir seek yapılmaz.
+    def tell(self):
+        return self.size if self.at_end else self.position
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END and offset == 0:
+            self.at_end = True
+        elif whence == os.SEEK_SET and offset == self.position:
+            self.at_end = False
+        else:
+            raise OSError("TelegramFileStream sadece ileri okunabilir")
+        return self.tell()
+    
+    def close(self):
+        self.response.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def stream_to_cloudinary(file_path, file_size, resource_type, trace, **fields):
+    """Telegram dosyasını belleğe almadan Cloudinary'e chunk'lar halinde yükler.
+    
+    Yükleme sonucunu ve okunurken hesaplanan SHA-256 hash'ini döner. İndirme ve
+    yükleme iç içe yürüdüğü için Telegram'dan okuma süresi ayrıca ölçülür,
+    kalan süre Cloudinary'e yazılır.
+    """
+    started = time.perf_counter()
+    stream = TelegramFileStream(file_path, file_size)
+    try:
+        result = cloudinary.uploader.upload_large(
+            stream,
+            resource_type=resource_type,
+            folder='telegram_instagram',
+            chunk_size=UPLOAD_CHUNK_SIZE
+        )
+    finally:
+        elapsed = time.perf_counter() - started
+        record_span(trace, 'telegram_download', stream.read_seconds, **fields)
+        record_span(trace, 'cloudinary_upload', elapsed - stream.read_seconds, **fields)
+    observe('nexabot_cloudinary_upload_seconds', elapsed, resource_type=resource_type)
+    inc_counter('nexabot_upload_bytes_total', file_size, kind='original')
+    inc_counter('nexabot_upload_bytes_total', file_size, kind='uploaded')
+    return result, stream.sha256.hexdigest()
+
+def shrink_photo(data):
+    """Fotoğrafı en fazla PHOTO_MAX_WIDTH genişliğe küçültüp JPEG olarak sıkıştırır.
+    
+    Sonuç orijinalden küçük değilse ya da görüntü açılamazsa orijinali döner.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.width > PHOTO_MAX_WIDTH:
+                height = round(image.height * PHOTO_MAX_WIDTH / image.width)
+                image = image.resize((PHOTO_MAX_WIDTH, height), Image.LANCZOS)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True, progressive=True)
+    except Exception as e:
+        log(f"⚠️ Fotoğraf küçültülemedi, orijinali yüklenecek: {e}")
+        return data
+    
+    shrunk = output.getvalue()
+    return shrunk if len(shrunk) < len(data) else data
+
+def upload_photo(file_path, file_size, trace, **fields):
+    """Fotoğrafı indirip küçültür ve Cloudinary'e yükler.
+    
+    Fotoğraflar en fazla birkaç MB olduğundan bellekte işlenir. Hash orijinal
+    içerikten hesaplanır ki ayar değişse de aynı fotoğraf cache'te bulunsun.
+    """
+    with TelegramFileStream(file_path, file_size) as stream:
+        original = stream.read()
+    record_span(trace, 'telegram_download', stream.read_seconds, **fields)
+    
+    with span(trace, 'photo_resize', **fields):
+        data = shrink_photo(original)
+    
+    started = time.perf_counter()
+    with span(trace, 'cloudinary_upload', **fields):
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data),
+            resource_type='image',
+            folder='telegram_instagram'
+        )
+    observe('nexabot_cloudinary_upload_seconds', time.perf_counter() - started, resource_type='image')
+    
+    saved = len(original) - len(data)
+    inc_counter('nexabot_upload_bytes_total', len(original), kind='original')
+    inc_counter('nexabot_upload_bytes_total', len(data), kind='uploaded')
+    log_event('photo_upload', original_bytes=len(original), uploaded_bytes=len(data), saved_bytes=saved, **fields)
+    return result, stream.sha256.hexdigest()
 
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
@@ -210,16 +2022,17 @@ def handle_message(message):
         user_id = message.from_user.id
         text = message.text.strip()
         
-        print(f"📨 MESAJ ALINDI: '{text}' from {user_id}")
-        
-        if user_id not in user_sessions:
-            user_sessions[user_id] = {'state': 'ready'}
+        log(f"📨 MESAJ ALINDI: '{text}' from {user_id}")
         
-        session = user_sessions[user_id]
+        session = get_session(user_id)
+        if session is None:
+            session = {'state': 'ready'}
+            set_session(user_id, session)
         
         if session['state'] == 'waiting_caption':
             session['caption'] = text
             session['state'] = 'waiting_schedule'
+            save_session(user_id)
             
             schedule_options = """
 ⏰ *Ne zaman paylaşayım?*
@@ -244,11 +2057,17 @@ def handle_message(message):
                 bot.reply_to(message, "❌ Geçersiz zaman! Örnek: `1s` veya `yarın 09:00`")
                 return
             
-            success = schedule_post(user_id, session, schedule_time)
+            linked = get_linked_account(user_id)
+            if not linked and not INSTAGRAM_TOKEN:
+                bot.reply_to(message, "🔗 Önce Instagram hesabını bağla: `/link <token>`", parse_mode='Markdown')
+                return
+            
+            account = linked['ig_user_id'] if linked else DEFAULT_ACCOUNT
+            success = schedule_post(user_id, dict(session, account=account), schedule_time)
             
             if success:
                 time_str = schedule_time.strftime('%d.%m.%Y %H:%M')
-                media_type = 'Video' if session['media_type'] == 'video' else 'Fotoğraf'
+                media_type = media_label(session['media_type'])
                 bot.reply_to(message, 
                            f"✅ *{media_type} zamanlandı!* 🎉\n"
                            f"📅 {time_str}\n"
@@ -256,13 +2075,13 @@ def handle_message(message):
             else:
                 bot.reply_to(message, "❌ Zamanlanamadı!")
             
-            user_sessions[user_id] = {'state': 'ready'}
+            set_session(user_id, {'state': 'ready'})
             
         else:
             bot.reply_to(message, "📸 Medya göndererek başla!")
             
     except Exception as e:
-        print(f"❌ MESAJ İŞLEME HATASI: {str(e)}")
+        log(f"❌ MESAJ İŞLEME HATASI: {str(e)}")
         bot.reply_to(message, f"❌ Hata: {str(e)}")
 
 def parse_schedule_time(text):
@@ -302,11 +2121,8 @@ def parse_schedule_time(text):
         return None
 
 def schedule_post(user_id, session, schedule_time):
-    global post_id_counter
-    
     try:
         post = {
-            'id': post_id_counter,
             'user_id': user_id,
             'media_url': session['media_url'],
             'media_type': session['media_type'],
@@ -315,164 +2131,577 @@ def schedule_post(user_id, session, schedule_time):
             'status': 'pending',
             'created_at': datetime.now().isoformat(),
             'attempts': 0,
-            'error_message': None
+            'error_message': None,
+            'public_id': session.get('public_id'),
+            'spans': dict(session.get('spans', {})),
+            'account': session.get('account', DEFAULT_ACCOUNT)
         }
+        if session.get('children'):
+            post['children'] = session['children']
         
-        scheduled_posts.append(post)
-        post_id_counter += 1
+        post['id'] = insert_post(post)
+        register_post(post)
+        enqueue_post(post, schedule_time)
         
-        print(f"✅ Gönderi zamanlandı: {post['id']} - {session['media_type']}")
+        log(f"✅ Gönderi zamanlandı: {post['id']} - {session['media_type']}")
         return True
         
     except Exception as e:
-        print(f"❌ Schedule error: {e}")
+        log(f"❌ Schedule error: {e}")
         return False
 
-def post_to_instagram(media_url, caption, media_type='image'):
+def refresh_publish_quota(account, access_token):
+    limits = get_account_limits(account)
     try:
-        print(f"📤 Attempting to post {media_type} to Instagram...")
+        limit_result = graph_session.get(
+            f'{GRAPH_API_URL}/me/content_publishing_limit',
+            params={'fields': 'quota_usage,config', 'access_token': access_token},
+            timeout=GRAPH_TIMEOUTS['content_publishing_limit']
+        ).json()
+        data = (limit_result.get('data') or [{}])[0]
         
-        if media_type == 'image':
-            container_data = {
-                'image_url': media_url,
-                'caption': caption,
-                'access_token': INSTAGRAM_TOKEN
-            }
-            endpoint = 'https://graph.instagram.com/me/media'
-            container_type = "IMAGE"
-            print("🔧 Creating IMAGE container...")
-        else:
-            container_data = {
-                'media_type': 'REELS',
-                'video_url': media_url,
-                'caption': caption,
-                'access_token': INSTAGRAM_TOKEN
+        with quota_lock:
+            limits['usage'] = data.get('quota_usage', limits['usage'])
+            limits['total'] = data.get('config', {}).get('quota_total', limits['total'])
+            limits['checked_at'] = time.time()
+        log(f"📊 Instagram kota ({account}): {limits['usage']}/{limits['total']}")
+        
+    except Exception as e:
+        log(f"⚠️ Kota sorgulanamadı ({account}): {safe_error(e)}")
+        with quota_lock:
+            limits['checked_at'] = time.time()
+
+def publish_slot_delay(account, access_token):
+    """Hesabın kotasında yer varsa 0 döner ve bir yer ayırır.
+    
+    Kota dolmuşsa gönderinin kaç saniye ertelenmesi gerektiğini döner.
+    Dakikalık hız limiti next_ready_post'ta uygulanır.
+    """
+    limits = get_account_limits(account)
+    with quota_lock:
+        at_cap = limits['usage'] >= limits['total']
+        max_age = 60 if at_cap else QUOTA_REFRESH_INTERVAL
+        stale = time.time() - limits['checked_at'] > max_age
+    
+    if stale:
+        refresh_publish_quota(account, access_token)
+    
+    with quota_lock:
+        if limits['usage'] >= limits['total']:
+            return PUBLISH_QUOTA_DEFER
+        
+        limits['usage'] += 1
+        return 0
+
+def defer_post(post, seconds, reason):
+    """Gönderiyi başarısız saymadan ileri bir zamana tekrar kuyruğa alır."""
+    due_time = datetime.now() + timedelta(seconds=seconds)
+    # Kısa hız limiti beklemeleri kullanıcıya bildirilmez; kota için bir kez haber ver
+    announce = seconds >= 60 and not post.get('deferral_notified')
+    released = release_post(
+        post,
+        status='pending',
+        stage='deferred',
+        scheduled_time=due_time.isoformat(),
+        deferred_count=post.get('deferred_count', 0) + 1,
+        deferral_notified=post.get('deferral_notified') or announce
+    )
+    if not released:
+        return
+    enqueue_post(post, due_time)
+    inc_counter('nexabot_publish_deferred_total', reason=reason)
+    log(f"⏸️ Post {post['id']} ertelendi ({reason}): {seconds:.0f}s")
+    
+    if announce:
+        notify(
+            post['user_id'],
+            f"⏸️ Instagram paylaşım limiti doldu, gönderin "
+            f"{due_time.strftime('%d.%m.%Y %H:%M')} civarında tekrar denenecek."
+        )
+
+ACCESS_TOKEN_PATTERN = re.compile(r'(access_token=)[^&\s\'"]+')
+
+def safe_error(e):
+    """İstisnanın loglanıp veritabanına yazılabilecek hali.
+    
+    requests istisnalarının metni access_token'lı tam URL'i içerir; onlar için
+    sadece tür ve endpoint yolu, diğerleri için token'ı maskelenmiş metin döner.
+    """
+    request = getattr(e, 'request', None)
+    url = getattr(request, 'url', None)
+    if url:
+        return f'{type(e).__name__} ({urlparse(url).path})'
+    return ACCESS_TOKEN_PATTERN.sub(r'\1***', f'{type(e).__name__}: {e}')
+
+def graph_error(result, prefix, fallback):
+    """Graph API hata cevabını post_to_instagram'ın dönüş formatına çevirir."""
+    error = result.get('error', {})
+    error_msg = error.get('message', fallback)
+    rate_limited = (
+        error.get('code') in RATE_LIMIT_ERROR_CODES
+        or error.get('error_subcode') == PUBLISH_LIMIT_SUBCODE
+    )
+    transient = bool(error.get('is_transient')) or error.get('code') in TRANSIENT_ERROR_CODES
+    return {'error': f'{prefix}: {error_msg}', 'rate_limited': rate_limited, 'transient': transient}
+
+def initial_poll_interval(media_type):
+    samples = sorted(container_ready_stats.get(media_type, ()))
+    if not samples:
+        return 3.0 if media_type == 'video' else 1.0
+    
+    # Medyanın tipik hazırlanma süresinin ~1/4'ü ile başla
+    median = samples[len(samples) // 2]
+    return min(max(median / 4, 0.5), 15.0)
+
+def wait_for_container(creation_id, media_type, access_token):
+    """Container FINISHED olana kadar status_code'u artan aralıklarla sorgular.
+    
+    Hazırsa None, değilse post_to_instagram formatında bir hata döner.
+    """
+    started = time.time()
+    interval = initial_poll_interval(media_type)
+    status_url = f'{GRAPH_API_URL}/{creation_id}'
+    params = {
+        'fields': 'status_code,status',
+        'access_token': access_token
+    }
+    
+    while True:
+        status_result = graph_session.get(
+            status_url, params=params, timeout=GRAPH_TIMEOUTS['container_status']
+        ).json()
+        status_code = status_result.get('status_code')
+        elapsed = time.time() - started
+        
+        if status_code == 'FINISHED':
+            container_ready_stats[media_type].append(elapsed)
+            log(f"✅ Container {creation_id} ready in {elapsed:.1f}s")
+            return None
+        
+        if status_code in ('ERROR', 'EXPIRED'):
+            inc_counter('nexabot_instagram_api_errors_total', endpoint='container_status')
+            detail = status_result.get('status') or status_code
+            # EXPIRED container yeniden oluşturulabilir; ERROR medyanın kendisinde sorun demek
+            return {
+                'error': f'Container {status_code.lower()}: {detail}',
+                'transient': status_code == 'EXPIRED'
             }
-            endpoint = 'https://graph.instagram.com/me/media'
-            container_type = "REELS"
-            print("🔧 Creating VIDEO container...")
         
-        container_response = requests.post(endpoint, data=container_data, timeout=60)
-        container_result = container_response.json()
-        print(f"📦 Container response: {container_result}")
+        if 'error' in status_result:
+            inc_counter('nexabot_instagram_api_errors_total', endpoint='container_status')
+            return graph_error(status_result, 'Container status failed', 'Unknown status error')
         
-        if 'id' not in container_result:
-            error_msg = container_result.get('error', {}).get('message', 'Unknown container error')
-            return {'error': f'Container failed: {error_msg}'}
+        if elapsed + interval > CONTAINER_READY_TIMEOUT:
+            return {
+                'error': f'Media not ready after {CONTAINER_READY_TIMEOUT}s (status: {status_code})',
+                'transient': True
+            }
         
-        creation_id = container_result['id']
-        print(f"✅ {container_type} container created: {creation_id}")
+        log(f"⏳ Container {creation_id} {status_code}, {interval:.1f}s sonra tekrar...")
+        time.sleep(interval)
+        interval = min(interval * 1.5, 15.0)
+
+def create_container(container_data, access_token):
+    """me/media üzerinde container oluşturur; (creation_id, None) ya da (None, hata) döner."""
+    container_data = dict(container_data, access_token=access_token)
+    container_response = graph_session.post(
+        f'{GRAPH_API_URL}/me/media', data=container_data, timeout=GRAPH_TIMEOUTS['media']
+    )
+    container_result = container_response.json()
+    log(f"📦 Container response: {container_result}")
+    
+    if 'id' not in container_result:
+        inc_counter('nexabot_instagram_api_errors_total', endpoint='media')
+        return None, graph_error(container_result, 'Container failed', 'Unknown container error')
+    return container_result['id'], None
+
+def create_carousel_item(child, access_token):
+    if child['media_type'] == 'image':
+        container_data = {'image_url': child['media_url'], 'is_carousel_item': 'true'}
+    else:
+        container_data = {'media_type': 'VIDEO', 'video_url': child['media_url'], 'is_carousel_item': 'true'}
+    
+    creation_id, error = create_container(container_data, access_token)
+    if error:
+        return None, error
+    
+    error = wait_for_container(creation_id, child['media_type'], access_token)
+    return (None, error) if error else (creation_id, None)
+
+def create_carousel_container(children, caption, access_token):
+    """Çocuk container'ları paralel oluşturup hazır olmalarını bekler, sonra CAROUSEL container'ı açar.
+    
+    Toplam süre en yavaş medyanınki kadardır, hepsinin toplamı kadar değil.
+    """
+    log(f"🔧 Creating CAROUSEL with {len(children)} items...")
+    with ThreadPoolExecutor(max_workers=len(children)) as executor:
+        results = list(executor.map(lambda child: create_carousel_item(child, access_token), children))
+    
+    for _, error in results:
+        if error:
+            return None, dict(error, error=f"Carousel item failed: {error['error']}")
+    
+    return create_container({
+        'media_type': 'CAROUSEL',
+        'children': ','.join(creation_id for creation_id, _ in results),
+        'caption': caption
+    }, access_token)
+
+def post_to_instagram(media_url, caption, media_type='image', on_stage=None, children=None, trace=None,
+                      access_token=None):
+    if access_token is None:
+        access_token = INSTAGRAM_TOKEN
+    if on_stage is None:
+        on_stage = lambda stage: None
+    if trace is None:
+        trace = {}
+    fields = {'post_id': trace.get('id'), 'media_type': media_type}
+    
+    try:
+        log(f"📤 Attempting to post {media_type} to Instagram...")
         
-        if media_type == 'video':
-            print("⏳ Waiting 60 seconds for video processing...")
-            time.sleep(60)
+        if media_type == 'carousel':
+            container_type = "CAROUSEL"
+            # Çocuk container'ların hazır olma beklemesi de bu aşamaya dahildir
+            with span(trace, 'container_create', **fields):
+                creation_id, error = create_carousel_container(children, caption, access_token)
         else:
-            print("⏳ Waiting 15 seconds for image processing...")
-            time.sleep(15)
+            if media_type == 'image':
+                container_data = {
+                    'image_url': media_url,
+                    'caption': caption
+                }
+                container_type = "IMAGE"
+            else:
+                container_data = {
+                    'media_type': 'REELS',
+                    'video_url': media_url,
+                    'caption': caption
+                }
+                container_type = "REELS"
+            
+            log(f"🔧 Creating {container_type} container...")
+            with span(trace, 'container_create', **fields):
+                creation_id, error = create_container(container_data, access_token)
+        
+        if error:
+            return error
+        
+        log(f"✅ {container_type} container created: {creation_id}")
+        on_stage('container_created')
+        
+        with span(trace, 'container_wait', **fields):
+            ready_error = wait_for_container(creation_id, media_type, access_token)
+        if ready_error:
+            return ready_error
         
-        publish_url = 'https://graph.instagram.com/me/media_publish'
+        publish_url = f'{GRAPH_API_URL}/me/media_publish'
         publish_data = {
             'creation_id': creation_id,
-            'access_token': INSTAGRAM_TOKEN
+            'access_token': access_token
         }
         
-        print("🚀 Publishing...")
-        publish_response = requests.post(publish_url, data=publish_data, timeout=30)
-        publish_result = publish_response.json()
+        log("🚀 Publishing...")
+        if on_stage('publishing') is False:
+            return {'error': 'Lease lost before publish', 'lease_lost': True}
+        with span(trace, 'publish', **fields):
+            publish_response = graph_session.post(publish_url, data=publish_data, timeout=GRAPH_TIMEOUTS['media_publish'])
+            publish_result = publish_response.json()
         
-        print(f"📮 Publish response: {publish_result}")
+        log(f"📮 Publish response: {publish_result}")
         
         if 'id' in publish_result:
-            print(f"✅ Successfully published {media_type}: {publish_result['id']}")
+            log(f"✅ Successfully published {media_type}: {publish_result['id']}")
             return {
                 'id': publish_result['id'],
                 'type': container_type,
                 'media_type': media_type
             }
         else:
-            error_msg = publish_result.get('error', {}).get('message', 'Unknown publish error')
-            return {'error': f'Publish failed: {error_msg}'}
+            inc_counter('nexabot_instagram_api_errors_total', endpoint='media_publish')
+            return graph_error(publish_result, 'Publish failed', 'Unknown publish error')
             
     except requests.exceptions.Timeout:
-        return {'error': 'Instagram API timeout'}
+        inc_counter('nexabot_instagram_api_errors_total', endpoint='timeout')
+        return {'error': 'Instagram API timeout', 'transient': True}
+    except requests.exceptions.ConnectionError as e:
+        inc_counter('nexabot_instagram_api_errors_total', endpoint='connection')
+        return {'error': f'Instagram API connection error: {safe_error(e)}', 'transient': True}
     except Exception as e:
-        return {'error': f'Unexpected error: {str(e)}'}
+        inc_counter('nexabot_instagram_api_errors_total', endpoint='exception')
+        return {'error': f'Unexpected error: {safe_error(e)}', 'transient': True}
+
+def enqueue_post(post, due_time):
+    """Bekleyen gönderiyi heap'e ekler, daha erken ise scheduler'ı uyandırır."""
+    with scheduler_cond:
+        heapq.heappush(pending_heap, (due_time, post['id'], post))
+        if pending_heap[0][2] is post:
+            scheduler_cond.notify()
+
+def next_due_post():
+    """Sıradaki gönderinin zamanı gelene kadar bekler ve onu heap'ten çıkarır."""
+    with scheduler_cond:
+        while True:
+            if not pending_heap:
+                scheduler_cond.wait()
+                continue
+            
+            due_time, _, post = pending_heap[0]
+            delay = (due_time - datetime.now()).total_seconds()
+            if delay > 0:
+                scheduler_cond.wait(timeout=delay)
+                continue
+            
+            heapq.heappop(pending_heap)
+            # İptal edilmiş/işlenmiş ya da zamanı değişmiş gönderiler heap'te kalmış olabilir
+            if post['status'] == 'pending' and post['scheduled_time'] == due_time.isoformat():
+                return post
+
+def set_post_stage(post, stage):
+    """Aşamayı kaydeder; 'publishing' öncesi lease kaybedildiyse False döner."""
+    if stage == 'publishing' and not confirm_lease(post):
+        return False
+    update_post(post, stage=stage)
+    log(f"📍 Post {post['id']} stage: {stage}")
+    return True
+
+def process_post(post):
+    log(f"🔄 Processing {post['media_type']} post {post['id']}")
+    started = time.time()
+    account = post_account(post)
+    
+    access_token = account_token(account)
+    if not access_token:
+        fail_post(post, "Instagram hesabı bağlı değil, /link ile tekrar bağlayın", False)
+        return
+    
+    # Hesabın kotası doluysa gönderiyi başarısız saymadan ertele
+    delay = publish_slot_delay(account, access_token)
+    if delay:
+        defer_post(post, delay, 'quota')
+        return
+    
+    try:
+        # Kullanıcıya işlem başladı bildirimi - tekrar denemelerde ve ertelemelerden sonra gönderilmez
+        if not post.get('processing_notified'):
+            media_type = media_label(post['media_type'])
+            notify(post['user_id'], f"🔄 {media_type} gönderiniz Instagram'a işleniyor...")
+            update_post(post, processing_notified=True)
+        
+        # INSTAGRAM'A GÖNDER
+        result = post_to_instagram(
+            post['media_url'], 
+            post['caption'], 
+            post['media_type'],
+            on_stage=lambda stage: set_post_stage(post, stage),
+            children=post.get('children'),
+            trace=post,
+            access_token=access_token
+        )
+        
+        if 'id' in result:
+            release_post(
+                post,
+                status='completed',
+                stage='done',
+                error_message=None,
+                post_id=result['id'],
+                post_type=result.get('type', 'unknown'),
+                completed_at=datetime.now().isoformat()
+            )
+            publish_times.append(time.time())
+            schedule_asset_cleanup(media_assets(post), 'published')
+            observe('nexabot_publish_duration_seconds', time.time() - started, media_type=post['media_type'])
+            delay = (datetime.now() - datetime.fromisoformat(post['scheduled_time'])).total_seconds()
+            observe('nexabot_publish_delay_seconds', max(delay, 0), media_type=post['media_type'])
+            log_event(
+                'post_published',
+                post_id=post['id'],
+                media_type=post['media_type'],
+                attempts=post['attempts'] + 1,
+                spans=post.get('spans', {})
+            )
+            
+            # BAŞARI BİLDİRİMİ
+            media_type = media_label(post['media_type'])
+            post_type = result.get('type', 'Gönderi')
+            notify(
+                post['user_id'],
+                f"✅ *{media_type} gönderiniz paylaşıldı!* 🎉\n\n"
+                f"📝 {escape_markdown(post['caption'][:50])}...\n"
+                f"📊 Tip: {post_type}\n"
+                f"🆔 ID: `{result['id']}`",
+                markdown=True
+            )
+                
+            log(f"✅ {post['media_type']} post {post['id']} completed!")
+            
+        elif result.get('lease_lost'):
+            # Gönderi başka bir instance'a geçti; onun paylaşmasına bırak
+            inc_counter('nexabot_lease_total', result='lost')
+            log(f"⚠️ Post {post['id']} paylaşımdan önce lease'i kaybetti, bırakıldı")
+            refresh_post(post['id'])
+            
+        elif result.get('rate_limited'):
+            # API limiti: kotayı yeniden sorgulat ve ertele
+            limits = get_account_limits(account)
+            with quota_lock:
+                limits['checked_at'] = 0.0
+            defer_post(post, PUBLISH_QUOTA_DEFER, 'throttled')
+            
+        else:
+            fail_post(post, result.get('error', 'Unknown error'), result.get('transient', False))
+            
+    except Exception as e:
+        # Paylaşıldıktan sonraki bir hata (ör. bildirim) gönderiyi tekrar denetmemeli
+        if post['status'] == 'completed':
+            log(f"⚠️ Post {post['id']} paylaşıldı ama sonrasında hata: {e}")
+            return
+        fail_post(post, safe_error(e), True)
+
+def retry_delay(attempts):
+    """Üstel artan bekleme süresi, aynı anda düşen gönderiler dağılsın diye jitter'lı."""
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+def fail_post(post, error_message, transient):
+    attempts = post['attempts'] + 1
+    
+    if transient and attempts < MAX_PUBLISH_ATTEMPTS:
+        # Worker'ı bekletmeden scheduler'a geri ver
+        delay = retry_delay(attempts)
+        due_time = datetime.now() + timedelta(seconds=delay)
+        released = release_post(
+            post,
+            attempts=attempts,
+            error_message=error_message,
+            status='pending',
+            stage='retry_wait',
+            scheduled_time=due_time.isoformat()
+        )
+        if not released:
+            return
+        enqueue_post(post, due_time)
+        inc_counter('nexabot_publish_retries_total', media_type=post['media_type'])
+        log(f"🔁 Post {post['id']} deneme {attempts}/{MAX_PUBLISH_ATTEMPTS} başarısız, {delay:.0f}s sonra tekrar: {error_message}")
+        return
+    
+    if not release_post(
+        post,
+        attempts=attempts,
+        error_message=error_message,
+        status='failed',
+        stage='failed'
+    ):
+        return
+    schedule_asset_cleanup(media_assets(post), 'failed')
+    inc_counter('nexabot_publish_failures_total', media_type=post['media_type'], transient=str(transient).lower())
+    
+    log(f"❌ Post {post['id']} failed: {error_message}")
+    log_event(
+        'post_failed',
+        post_id=post['id'],
+        media_type=post['media_type'],
+        attempts=attempts,
+        transient=transient,
+        spans=post.get('spans', {})
+    )
+    
+    # HATA BİLDİRİMİ - denemeler bittiğinde tek özet mesaj
+    notify(
+        post['user_id'],
+        f"❌ *Gönderi hatası!*\n\n"
+        f"{attempts} deneme yapıldı.\n"
+        f"Hata: {escape_markdown(error_message[:100])}",
+        markdown=True
+    )
+
+def add_ready_post(post):
+    account = post_account(post)
+    with ready_cond:
+        if account not in ready_queues:
+            ready_queues[account] = deque()
+            ready_accounts.append(account)
+        ready_queues[account].append(post)
+        ready_cond.notify()
+
+def next_ready_post():
+    """Sıradaki hesabın en eski hazır gönderisini döner.
+    
+    Dakikalık hız limitine takılan hesap atlanır, gönderileri kuyruğunda bekler.
+    """
+    with ready_cond:
+        while True:
+            retry_in = None
+            for _ in range(len(ready_accounts)):
+                account = ready_accounts.popleft()
+                posts = ready_queues[account]
+                # Bu arada başka bir instance'ın aldığı ya da ertelediği gönderileri at;
+                # ertelenenler zamanı gelince heap'ten tekrar gelir
+                now = datetime.now().isoformat()
+                while posts and (posts[0]['status'] != 'pending' or posts[0]['scheduled_time'] > now):
+                    posts.popleft()
+                if not posts:
+                    del ready_queues[account]
+                    continue
+                
+                ready_accounts.append(account)
+                wait = get_account_limits(account)['bucket'].try_acquire()
+                if wait:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                return posts.popleft()
+            
+            ready_cond.wait(timeout=retry_in)
 
 def process_scheduled_posts():
     while True:
         try:
-            now = datetime.now()
-            
-            for post in scheduled_posts:
-                if post['status'] == 'pending':
-                    scheduled_time = datetime.fromisoformat(post['scheduled_time'])
-                    
-                    if scheduled_time <= now:
-                        print(f"🔄 Processing {post['media_type']} post {post['id']}")
-                        post['status'] = 'processing'
-                        
-                        try:
-                            # Kullanıcıya işlem başladı bildirimi
-                            media_type = 'Video' if post['media_type'] == 'video' else 'Fotoğraf'
-                            bot.send_message(post['user_id'], f"🔄 {media_type} gönderiniz Instagram'a işleniyor...")
-                            
-                            # INSTAGRAM'A GÖNDER
-                            result = post_to_instagram(
-                                post['media_url'], 
-                                post['caption'], 
-                                post['media_type']
-                            )
-                            
-                            if 'id' in result:
-                                post['status'] = 'completed'
-                                post['post_id'] = result['id']
-                                post['post_type'] = result.get('type', 'unknown')
-                                post['completed_at'] = datetime.now().isoformat()
-                                
-                                # BAŞARI BİLDİRİMİ
-                                media_type = 'Video' if post['media_type'] == 'video' else 'Fotoğraf'
-                                post_type = result.get('type', 'Gönderi')
-                                bot.send_message(
-                                    post['user_id'],
-                                    f"✅ *{media_type} gönderiniz paylaşıldı!* 🎉\n\n"
-                                    f"📝 {post['caption'][:50]}...\n"
-                                    f"📊 Tip: {post_type}\n"
-                                    f"🆔 ID: `{result['id']}`",
-                                    parse_mode='Markdown'
-                                )
-                                    
-                                print(f"✅ {post['media_type']} post {post['id']} completed!")
-                                
-                            else:
-                                raise Exception(result.get('error', 'Unknown error'))
-                                
-                        except Exception as e:
-                            post['attempts'] += 1
-                            post['error_message'] = str(e)
-                            post['status'] = 'failed'
-                            
-                            print(f"❌ Post {post['id']} failed: {e}")
-                            
-                            # HATA BİLDİRİMİ
-                            bot.send_message(
-                                post['user_id'],
-                                f"❌ *Gönderi hatası!*\n\nHata: {str(e)[:100]}",
-                                parse_mode='Markdown'
-                            )
-            
-            time.sleep(30)
+            add_ready_post(next_due_post())
+        except Exception as e:
+            log(f"❌ Scheduler error: {e}")
+            time.sleep(5)
+
+def dispatch_posts():
+    while True:
+        publish_slots.acquire()
+        try:
+            post = next_ready_post()
+            if not claim_post(post):
+                # Başka bir instance almış ya da değiştirmiş; güncel halini oku
+                publish_slots.release()
+                refresh_post(post['id'])
+                continue
+            publish_queue.put((post, time.perf_counter()))
             
         except Exception as e:
-            print(f"❌ Scheduler error: {e}")
-            time.sleep(60)
+            publish_slots.release()
+            log(f"❌ Dispatcher error: {e}")
+            time.sleep(5)
+
+def publish_worker():
+    while True:
+        post, queued_at = publish_queue.get()
+        try:
+            record_span(post, 'queue_wait', time.perf_counter() - queued_at, post_id=post['id'])
+            process_post(post)
+        except Exception as e:
+            log(f"❌ Publish worker error: {e}")
+        finally:
+            publish_queue.task_done()
+            publish_slots.release()
+
+def posts_per_minute():
+    cutoff = time.time() - 60
+    return sum(1 for t in publish_times if t >= cutoff)
 
 # FLASK ROUTES
 @app.route('/')
 def home():
-    photo_count = len([p for p in scheduled_posts if p.get('media_type') == 'image'])
-    video_count = len([p for p in scheduled_posts if p.get('media_type') == 'video'])
-    completed_count = len([p for p in scheduled_posts if p.get('status') == 'completed'])
-    pending_count = len([p for p in scheduled_posts if p.get('status') == 'pending'])
+    photo_count = post_counts[('media_type', 'image')]
+    video_count = post_counts[('media_type', 'video')]
+    completed_count = post_counts[('status', 'completed')]
+    pending_count = post_counts[('status', 'pending')]
     
     return f"""
     <html>
@@ -490,7 +2719,7 @@ def home():
             
             <div class="stats">
                 <h3>📊 Sistem İstatistikleri</h3>
-                <div class="stat-item"><strong>Toplam Gönderi:</strong> {len(scheduled_posts)}</div>
+                <div class="stat-item"><strong>Toplam Gönderi:</strong> {sum(count for (kind, _), count in list(post_counts.items()) if kind == 'status')}</div>
                 <div class="stat-item"><strong>Aktif Kullanıcı:</strong> {len(user_sessions)}</div>
                 <div class="stat-item"><strong>📸 Fotoğraf:</strong> {photo_count}</div>
                 <div class="stat-item"><strong>🎥 Video:</strong> {video_count}</div>
@@ -510,42 +2739,209 @@ def health_check():
         'service': 'Nexabot',
         'timestamp': datetime.now().isoformat(),
         'scheduled_posts': len(scheduled_posts),
-        'active_users': len(user_sessions)
+        'active_users': len(user_sessions),
+        'publish_workers': PUBLISH_WORKERS,
+        'publish_queue': publish_queue.qsize(),
+        'ready_accounts': len(ready_queues),
+        'outbox': len(outbox),
+        'posts_per_minute': posts_per_minute(),
+        'ingest': ingest_stats(),
+        'media_cache': media_cache_stats()
     })
 
+@app.route('/metrics')
+def metrics():
+    gauges = {
+        'nexabot_scheduler_pending': len(pending_heap),
+        'nexabot_publish_queue_depth': publish_queue.qsize(),
+        'nexabot_ready_posts': sum(len(posts) for posts in list(ready_queues.values())),
+        'nexabot_ingest_queue_depth': ingest_queue.qsize(),
+        'nexabot_ingest_active': ingest_active,
+        'nexabot_update_queue_depth': update_queue.qsize(),
+        'nexabot_db_write_queue_depth': db_write_queue.qsize(),
+        'nexabot_sessions': len(user_sessions),
+        'nexabot_outbox_pending': len(outbox)
+    }
+    # nexabot_posts_by_status / nexabot_posts_by_media_type: ayrı isimler, toplanınca çift sayılmasın
+    for (kind, value), count in list(post_counts.items()):
+        gauges[f'nexabot_posts_by_{kind}{{{kind}="{value}"}}'] = count
+    
+    return Response(render_metrics(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def debug_profile():
+    if PROFILE_INTERVAL <= 0:
+        return 'profiler disabled (PROFILE_INTERVAL)', 404
+    
+    with profile_lock:
+        samples = profile_samples.most_common()
+        if request.args.get('reset') == '1':
+            profile_samples.clear()
+    
+    lines = [f'{stack} {count}' for stack, count in samples]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    if BOT_MODE != 'webhook':
+        return 'not found', 404
+    if not secrets.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET):
+        return 'forbidden', 403
+    
+    update_json = request.get_json(silent=True)
+    if not update_json or 'update_id' not in update_json:
+        return 'bad request', 400
+    
+    update_id = update_json['update_id']
+    with seen_updates_lock:
+        if update_id in seen_update_ids:
+            inc_counter('nexabot_webhook_updates_total', result='duplicate')
+            return 'ok', 200
+        seen_update_ids[update_id] = True
+        if len(seen_update_ids) > 10000:
+            seen_update_ids.popitem(last=False)
+    
+    try:
+        update_queue.put_nowait(update_json)
+    except queue.Full:
+        # Telegram 2xx olmayan cevaplarda update'i tekrar gönderir
+        with seen_updates_lock:
+            seen_update_ids.pop(update_id, None)
+        inc_counter('nexabot_webhook_updates_total', result='rejected')
+        return 'busy', 503
+    
+    inc_counter('nexabot_webhook_updates_total', result='queued')
+    return 'ok', 200
+
+def update_worker():
+    while True:
+        update_json = update_queue.get()
+        try:
+            update = types.Update.de_json(update_json)
+            bot.process_new_updates([update])
+        except Exception as e:
+            log(f"❌ Update worker error: {e}")
+        finally:
+            update_queue.task_done()
+
+def start_webhook():
+    for i in range(UPDATE_WORKERS):
+        worker = threading.Thread(target=update_worker, name=f"update-{i}")
+        worker.daemon = True
+        worker.start()
+    
+    backoff = 1
+    while True:
+        try:
+            log(f"🟢 WEBHOOK AYARLANIYOR: {WEBHOOK_URL}/telegram/webhook")
+            bot.set_webhook(
+                url=f"{WEBHOOK_URL}/telegram/webhook",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=UPDATE_WORKERS * 2
+            )
+            return
+        except Exception as e:
+            log(f"❌ WEBHOOK HATASI: {str(e)}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
 def start_bot():
-    print("🤖🤖🤖 BOT THREAD BAŞLIYOR...")
-    time.sleep(5)  # Flask'ın başlaması için bekle
+    log("🤖🤖🤖 BOT THREAD BAŞLIYOR...")
     
+    if BOT_MODE == 'webhook':
+        start_webhook()
+        return
+    
+    backoff = 1
     while True:
+        started = time.time()
         try:
-            print("🔴 WEBHOOK TEMİZLE...")
+            log("🔴 WEBHOOK TEMİZLE...")
             bot.remove_webhook()
-            time.sleep(2)
-            print("🟢 POLLING BAŞLAT...")
+            log("🟢 POLLING BAŞLAT...")
             bot.polling(none_stop=True, timeout=60)
         except Exception as e:
-            print(f"❌ BOT HATASI: {str(e)}")
-            time.sleep(10)
+            log(f"❌ BOT HATASI: {str(e)}")
+        
+        # Uzun süre sorunsuz çalıştıysa beklemeyi sıfırla
+        if time.time() - started > 60:
+            backoff = 1
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
 
-if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 10000))
+def start_background_threads():
+    """Veritabanı yazıcısı, scheduler, worker'lar ve bot thread'lerini başlatır."""
+    db_writer_thread = threading.Thread(target=db_writer, name="db-writer")
+    db_writer_thread.daemon = True
+    db_writer_thread.start()
+    
+    sweeper_thread = threading.Thread(target=session_sweeper, name="session-sweeper")
+    sweeper_thread.daemon = True
+    sweeper_thread.start()
     
-    print("=" * 60)
-    print("🚀 NEXABOT DIRECT START...")
-    print(f"📍 Port: {port}")
-    print("=" * 60)
+    collector_thread = threading.Thread(target=asset_collector, name="asset-collector")
+    collector_thread.daemon = True
+    collector_thread.start()
+    
+    lease_thread = threading.Thread(target=lease_keeper, name="lease-keeper")
+    lease_thread.daemon = True
+    lease_thread.start()
     
     # Scheduler'ı başlat
-    scheduler_thread = threading.Thread(target=process_scheduled_posts)
+    scheduler_thread = threading.Thread(target=process_scheduled_posts, name="scheduler")
     scheduler_thread.daemon = True
     scheduler_thread.start()
     
+    dispatcher_thread = threading.Thread(target=dispatch_posts, name="dispatcher")
+    dispatcher_thread.daemon = True
+    dispatcher_thread.start()
+    
+    token_thread = threading.Thread(target=token_refresher, name="token-refresher")
+    token_thread.daemon = True
+    token_thread.start()
+    
+    # Publish worker'larını başlat
+    for i in range(PUBLISH_WORKERS):
+        worker = threading.Thread(target=publish_worker, name=f"publish-{i}")
+        worker.daemon = True
+        worker.start()
+    
+    # Medya ingest worker'larını başlat
+    for i in range(INGEST_WORKERS):
+        worker = threading.Thread(target=ingest_worker, name=f"ingest-{i}")
+        worker.daemon = True
+        worker.start()
+    
+    for i in range(NOTIFY_WORKERS):
+        worker = threading.Thread(target=notification_sender, name=f"notify-{i}")
+        worker.daemon = True
+        worker.start()
+    
     # Bot'u başlat
-    bot_thread = threading.Thread(target=start_bot)
+    bot_thread = threading.Thread(target=start_bot, name="bot")
     bot_thread.daemon = True
     bot_thread.start()
     
+    if PROFILE_INTERVAL > 0:
+        profiler_thread = threading.Thread(target=sampling_profiler, name="profiler")
+        profiler_thread.daemon = True
+        profiler_thread.start()
+        log(f"🔬 Profiler açık: her {PROFILE_INTERVAL}s örnek, /debug/profile")
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 10000))
+    
+    log("=" * 60)
+    log("🚀 NEXABOT DIRECT START...")
+    log(f"📍 Port: {port}")
+    log("=" * 60)
+    
+    # Veritabanını aç ve kayıtlı durumu yükle
+    init_db()
+    load_state()
+    
+    start_background_threads()
+    
     # Flask'ı başlat
-    print("🌐 Flask server starting...")
-    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
\ No newline at end of file
+    log("🌐 Flask server starting...")
+    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
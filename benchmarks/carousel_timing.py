@@ -0,0 +1,101 @@
+"""Albüm (carousel) paylaşım süresi ve Graph bağlantı havuzu kullanımı.
+
+Her publish worker'ı kadar albüm aynı anda post_to_instagram ile paylaşılır.
+Çocuk container'lar paralel hazırlandığından bir albüm yaklaşık bir çocuğun
+ve parent container'ın süresi kadar sürmeli, çocukların toplamı kadar değil.
+Aynı anda açılan bağlantılar graph_session havuzuna sığmalı; urllib3'ün
+"Connection pool is full" uyarısıyla attığı bağlantılar da sayılır.
+
+Koşullardan biri bozulursa betik hata koduyla çıkar.
+
+Örnek:
+    python benchmarks/carousel_timing.py --albums 4 --items 10 --image-delay 1
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import GraphStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAROUSEL_PARENT_DELAY = 0.5  # GraphStub'ta CAROUSEL container'ının hazırlanma süresi
+
+
+class PoolFullCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.discarded = 0
+
+    def emit(self, record):
+        if 'Connection pool is full' in record.getMessage():
+            self.discarded += 1
+
+
+def run(args):
+    graph = GraphStub(image_delay=args.image_delay).start()
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'INSTAGRAM_TOKEN': 'benchmark-token',
+        'GRAPH_API_URL': graph.url,
+        'DB_PATH': ':memory:',
+        'PUBLISH_WORKERS': str(args.albums)
+    })
+    counter = PoolFullCounter()
+    logging.getLogger('urllib3.connectionpool').addHandler(counter)
+
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import app
+
+        children = [
+            {'media_url': f'https://res.cloudinary.test/item{index}.jpg', 'media_type': 'image'}
+            for index in range(args.items)
+        ]
+
+        def publish(_):
+            started = time.perf_counter()
+            result = app.post_to_instagram(None, 'benchmark', 'carousel', children=children)
+            if 'id' not in result:
+                raise RuntimeError(f'Albüm paylaşılamadı: {result}')
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=args.albums) as executor:
+            durations = list(executor.map(publish, range(args.albums)))
+
+    return {
+        'albums': args.albums,
+        'items': args.items,
+        'image_delay_s': args.image_delay,
+        'album_max_s': round(max(durations), 2),
+        'sequential_estimate_s': round(args.items * args.image_delay + CAROUSEL_PARENT_DELAY, 2),
+        'pool_discarded_connections': counter.discarded
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Albüm paylaşım süresi')
+    parser.add_argument('--albums', type=int, default=4, help='Aynı anda paylaşılan albüm (= PUBLISH_WORKERS)')
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--image-delay', type=float, default=1.0, help='Graph stub: fotoğraf container süresi (s)')
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['albums']} albüm x {result['items']} fotoğraf: en yavaş albüm {result['album_max_s']}s "
+              f"(sıralı olsaydı ~{result['sequential_estimate_s']}s), "
+              f"havuzdan atılan bağlantı: {result['pool_discarded_connections']}")
+
+    if result['album_max_s'] >= result['sequential_estimate_s'] or result['pool_discarded_connections']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
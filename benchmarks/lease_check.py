@@ -0,0 +1,151 @@
+"""Aynı veritabanını paylaşan iki instance'ın lease davranışı kontrolü.
+
+Bir SQLite dosyasını paylaşan iki süreç açılır (bu betik --worker ile):
+
+1. A önce başlar ve en erken zamanlanmış videoları alır; videolar Graph stub'ında
+   yavaş hazırlandığından A onları container beklerken tutar.
+2. B başlar, A öldürülür. B kalan fotoğrafları paylaşır, A'nın lease'leri
+   LEASE_TTL sonunda dolunca videoları geri alıp paylaşır.
+
+Kontrol edilenler: her gönderi paylaşılmış, Instagram'a tam gönderi sayısı kadar
+media_publish gitmiş (hiçbiri iki kez paylaşılmamış) ve B, A'nın elindeki bütün
+gönderileri geri almış. Biri bozulursa betik hata koduyla çıkar.
+
+Örnek:
+    python benchmarks/lease_check.py --posts 30 --videos 3 --lease-ttl 6
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from stubs import GraphStub, TelegramStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until(condition, timeout, interval=0.1):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def count_posts(db_path, where):
+    with contextlib.closing(sqlite3.connect(db_path)) as connection:
+        return connection.execute(f'SELECT COUNT(*) FROM posts WHERE {where}').fetchone()[0]
+
+
+def worker(timeout):
+    """Bir instance: bütün thread'leri başlatır, gönderiler bitince sayaçları yazar."""
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(sys.stderr):
+        import app
+
+        app.init_db()
+        app.load_state()
+        app.start_background_threads()
+        wait_until(lambda: count_posts(app.DB_PATH, "status NOT IN ('completed', 'failed')") == 0, timeout)
+        counters = {
+            dict(labels)['result']: value
+            for (name, labels), value in app.metric_counters.items() if name == 'nexabot_lease_total'
+        }
+    print(json.dumps({'instance': app.INSTANCE_ID, 'lease': counters}))
+
+
+def run(args):
+    telegram = TelegramStub().start()
+    graph = GraphStub(image_delay=0.5, video_delay=args.lease_ttl * 3, quota_total=100000).start()
+    db_path = os.path.join(tempfile.mkdtemp(prefix='nexabot-lease-'), 'lease.db')
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN='123456:BENCHMARK',
+        INSTAGRAM_TOKEN='benchmark-token',
+        TELEGRAM_API_URL=telegram.url,
+        GRAPH_API_URL=graph.url,
+        DB_PATH=db_path,
+        LEASE_TTL=str(args.lease_ttl),
+        PUBLISH_WORKERS=str(args.videos),
+        PUBLISH_RATE_PER_MINUTE='100000',
+        TELEGRAM_GLOBAL_RATE='1000',
+        TELEGRAM_CHAT_RATE='1000'
+    )
+    os.environ.update(env)
+
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import app
+
+        app.init_db()
+        now = datetime.now()
+        for index in range(args.posts):
+            # Videolar önce gelir, A onları alsın diye
+            is_video = index < args.videos
+            app.schedule_post(1000 + index, {
+                'media_url': f'https://res.cloudinary.test/{index}',
+                'media_type': 'video' if is_video else 'image',
+                'caption': f'lease check {index}'
+            }, now if is_video else now + timedelta(seconds=2))
+        app.db.close()
+
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--timeout', str(args.timeout)]
+    log = open(os.devnull, 'w')
+    first = subprocess.Popen(command, env=env, stdout=log, stderr=log)
+    claimed = wait_until(lambda: count_posts(db_path, "status = 'processing'") == args.videos, 30)
+    second = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+    first.kill()
+    first.wait()
+    output, _ = second.communicate(timeout=args.timeout + 30)
+    survivor = json.loads(output.strip().splitlines()[-1])
+
+    return {
+        'posts': args.posts,
+        'videos_held_by_killed_instance': args.videos if claimed else 0,
+        'completed': count_posts(db_path, "status = 'completed'"),
+        'instagram_published': graph.published,
+        'reclaimed_by_survivor': survivor['lease'].get('reclaimed', 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='İki instance ile lease kontrolü')
+    parser.add_argument('--posts', type=int, default=30)
+    parser.add_argument('--videos', type=int, default=3, help='Öldürülen instance\'ın elinde kalacak gönderi')
+    parser.add_argument('--lease-ttl', type=int, default=6)
+    parser.add_argument('--timeout', type=float, default=90)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.timeout)
+        return
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['completed']}/{result['posts']} paylaşıldı, Instagram'a {result['instagram_published']} "
+              f"media_publish gitti; öldürülen instance'ın {result['videos_held_by_killed_instance']} gönderisinden "
+              f"{result['reclaimed_by_survivor']} tanesi geri alındı")
+
+    ok = (
+        result['completed'] == result['posts']
+        and result['instagram_published'] == result['posts']
+        and result['videos_held_by_killed_instance'] == args.videos
+        and result['reclaimed_by_survivor'] >= args.videos
+    )
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
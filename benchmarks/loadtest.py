@@ -0,0 +1,280 @@
+"""Nexabot offline yük testi.
+
+Telegram, Instagram Graph ve Cloudinary yerine benchmarks/stubs.py'deki yerel
+sunucuları açar, app.py'yi bunlara yönlendirip bütün thread'leriyle başlatır ve
+iki aşamayı ölçer:
+
+1. Ingest: her kullanıcı getUpdates üzerinden medya gönderir; handle_media ->
+   ingest kuyruğu -> getFile -> indirme -> Cloudinary upload -> "hazır" mesajı.
+2. Publish: hazır oturumlar hemen paylaşılmak üzere zamanlanır; scheduler ->
+   publish worker'ları -> me/media -> status_code -> me/media_publish.
+
+Örnek:
+    python benchmarks/loadtest.py --users 50 --photo-size 2MB --video-size 20MB --video-ratio 0.3
+
+--sweep-workers 1,2,4,8 aynı yükü her publish worker sayısı için ayrı bir süreçte
+çalıştırır (ayarlar import sırasında okunduğundan) ve post/dk'yı karşılaştırır.
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from stubs import CloudinaryStub, GraphStub, TelegramStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 * 1024}
+
+
+def parse_size(text):
+    text = text.upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def peak_rss_mb():
+    # Linux'ta ru_maxrss KB cinsindendir
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_until(condition, timeout, interval=0.02):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def load_posts(app, post_ids):
+    """Gönderilerin veritabanındaki hali; paylaşılan/hatalı gönderiler bellekte tutulmaz."""
+    placeholders = ', '.join('?' * len(post_ids))
+    with app.db_lock:
+        rows = app.db.execute(f'SELECT * FROM posts WHERE id IN ({placeholders})', post_ids).fetchall()
+    return [app.row_to_post(row) for row in rows]
+
+
+def configure_environment(args, telegram, graph, cloudinary_stub, db_path):
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'INSTAGRAM_TOKEN': 'benchmark-token',
+        'TELEGRAM_API_URL': telegram.url,
+        'GRAPH_API_URL': graph.url,
+        'CLOUDINARY_UPLOAD_PREFIX': cloudinary_stub.url,
+        'CLOUDINARY_CLOUD_NAME': 'benchmark',
+        'CLOUDINARY_API_KEY': 'benchmark',
+        'CLOUDINARY_API_SECRET': 'benchmark',
+        'DB_PATH': db_path,
+        'BOT_MODE': 'polling',
+        'PUBLISH_WORKERS': str(args.publish_workers),
+        'INGEST_WORKERS': str(args.ingest_workers),
+        'INGEST_QUEUE_SIZE': str(max(args.users * 2, 20)),
+        # Benchmark'ta ölçülen şey uygulamanın kendisi; limitler gevşek tutulur
+        'PUBLISH_RATE_PER_MINUTE': '100000',
+        'PUBLISH_QUOTA_DEFAULT': '100000',
+        'TELEGRAM_GLOBAL_RATE': '1000',
+        'TELEGRAM_CHAT_RATE': '100'
+    })
+    graph.quota_total = 100000
+
+
+def run(args):
+    telegram = TelegramStub().start()
+    graph = GraphStub(image_delay=args.image_delay, video_delay=args.video_delay).start()
+    cloudinary_stub = CloudinaryStub().start()
+
+    db_dir = tempfile.mkdtemp(prefix='nexabot-bench-')
+    configure_environment(args, telegram, graph, cloudinary_stub, os.path.join(db_dir, 'bench.db'))
+
+    sys.path.insert(0, REPO_ROOT)
+    log = sys.stdout if args.verbose else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(log):
+        import app
+
+        app.init_db()
+        app.load_state()
+        app.start_background_threads()
+        rss_baseline = peak_rss_mb()
+
+        # 1) INGEST
+        pushed_at = {}
+        kinds = {}
+        ingest_started = time.time()
+        for index in range(args.users):
+            user_id = 100000 + index
+            is_video = index < round(args.users * args.video_ratio)
+            kind = 'video' if is_video else 'photo'
+            size = args.video_size if is_video else args.photo_size
+            pushed_at[user_id] = time.time()
+            kinds[user_id] = kind
+            telegram.push_media(user_id, kind, size)
+
+        ready = lambda: all(
+            (app.user_sessions.get(user_id) or {}).get('state') == 'waiting_caption'
+            for user_id in pushed_at
+        )
+        ingest_ok = wait_until(ready, args.timeout)
+        ingest_elapsed = time.time() - ingest_started
+
+        ready_at = {}
+        for sent_at, chat_id, text in list(telegram.sent):
+            if 'hazır' in text and chat_id not in ready_at:
+                ready_at[chat_id] = sent_at
+        ingest_latencies = [ready_at[user_id] - pushed_at[user_id] for user_id in pushed_at if user_id in ready_at]
+
+        # 2) PUBLISH
+        publish_started = time.time()
+        post_ids = []
+        for user_id in pushed_at:
+            session = app.user_sessions.get(user_id)
+            if not session or session.get('state') != 'waiting_caption':
+                continue
+            post_session = dict(session, caption=f'benchmark {user_id}')
+            app.schedule_post(user_id, post_session, datetime.now())
+            with app.db_lock:
+                post_ids.append(app.db.execute('SELECT MAX(id) FROM posts WHERE user_id = ?', (user_id,)).fetchone()[0])
+
+        finished = lambda: all(post['status'] in ('completed', 'failed') for post in load_posts(app, post_ids))
+        publish_ok = wait_until(finished, args.timeout, interval=0.1)
+        publish_elapsed = time.time() - publish_started
+
+        completed = [post for post in load_posts(app, post_ids) if post['status'] == 'completed']
+        publish_latencies = [
+            (datetime.fromisoformat(post['completed_at']) - datetime.fromisoformat(post['created_at'])).total_seconds()
+            for post in completed
+        ]
+
+    total_media = args.photo_size * (args.users - round(args.users * args.video_ratio)) \
+        + args.video_size * round(args.users * args.video_ratio)
+
+    return {
+        'users': args.users,
+        'video_ratio': args.video_ratio,
+        'photo_size_bytes': args.photo_size,
+        'video_size_bytes': args.video_size,
+        'ingest_workers': args.ingest_workers,
+        'publish_workers': args.publish_workers,
+        'ingest': {
+            'completed': len(ingest_latencies),
+            'timed_out': not ingest_ok,
+            'elapsed_s': round(ingest_elapsed, 2),
+            'throughput_mb_s': round(total_media / (1024 * 1024) / ingest_elapsed, 2) if ingest_elapsed else 0,
+            'latency_p50_s': round(percentile(ingest_latencies, 50), 3),
+            'latency_p95_s': round(percentile(ingest_latencies, 95), 3),
+            'latency_p99_s': round(percentile(ingest_latencies, 99), 3)
+        },
+        'publish': {
+            'scheduled': len(post_ids),
+            'completed': len(completed),
+            'timed_out': not publish_ok,
+            'elapsed_s': round(publish_elapsed, 2),
+            'posts_per_minute': round(len(completed) / publish_elapsed * 60, 1) if publish_elapsed else 0,
+            'latency_p50_s': round(percentile(publish_latencies, 50), 3),
+            'latency_p95_s': round(percentile(publish_latencies, 95), 3)
+        },
+        'memory': {
+            'rss_after_start_mb': round(rss_baseline, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1)
+        },
+        'stubs': {
+            'telegram_downloaded_mb': round(telegram.downloaded_bytes / (1024 * 1024), 1),
+            'cloudinary_uploaded_mb': round(cloudinary_stub.uploaded_bytes / (1024 * 1024), 1),
+            'instagram_published': graph.published
+        }
+    }
+
+
+def print_report(result):
+    ingest = result['ingest']
+    publish = result['publish']
+    memory = result['memory']
+    print(f"Kullanıcı: {result['users']}  video oranı: {result['video_ratio']}  "
+          f"ingest worker: {result['ingest_workers']}  publish worker: {result['publish_workers']}")
+    print(f"Ingest : {ingest['completed']}/{result['users']} hazır, {ingest['elapsed_s']}s, "
+          f"{ingest['throughput_mb_s']} MB/s, p50 {ingest['latency_p50_s']}s, "
+          f"p95 {ingest['latency_p95_s']}s, p99 {ingest['latency_p99_s']}s"
+          + ('  (ZAMAN AŞIMI)' if ingest['timed_out'] else ''))
+    print(f"Publish: {publish['completed']}/{publish['scheduled']} paylaşıldı, {publish['elapsed_s']}s, "
+          f"{publish['posts_per_minute']} post/dk, p50 {publish['latency_p50_s']}s, p95 {publish['latency_p95_s']}s"
+          + ('  (ZAMAN AŞIMI)' if publish['timed_out'] else ''))
+    print(f"Bellek : başlangıç {memory['rss_after_start_mb']} MB, tepe RSS {memory['peak_rss_mb']} MB")
+
+
+def sweep_workers(args, argv):
+    """Her worker sayısı için bu betiği --json ile ayrı süreçte çalıştırır."""
+    results = []
+    base_argv = []
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg == '--sweep-workers':
+            skip_value = True
+        elif not arg.startswith('--sweep-workers=') and arg != '--json':
+            base_argv.append(arg)
+    # Aynı seçenek tekrar verilirse argparse sonuncuyu kullanır
+    for workers in args.sweep_workers:
+        command = [sys.executable, os.path.abspath(__file__)] + base_argv + ['--publish-workers', str(workers), '--json']
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output))
+    return results
+
+
+def print_sweep(results):
+    print(f"{'worker':>6}  {'post/dk':>8}  {'p50 (s)':>8}  {'p95 (s)':>8}  paylaşılan")
+    for result in results:
+        publish = result['publish']
+        print(f"{result['publish_workers']:>6}  {publish['posts_per_minute']:>8}  {publish['latency_p50_s']:>8}  "
+              f"{publish['latency_p95_s']:>8}  {publish['completed']}/{publish['scheduled']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Nexabot offline yük testi')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--video-ratio', type=float, default=0.25, help='Video gönderen kullanıcı oranı')
+    parser.add_argument('--photo-size', type=parse_size, default='1MB')
+    parser.add_argument('--video-size', type=parse_size, default='10MB')
+    parser.add_argument('--image-delay', type=float, default=1.0, help='Graph stub: fotoğraf container hazırlanma süresi (s)')
+    parser.add_argument('--video-delay', type=float, default=5.0, help='Graph stub: video container hazırlanma süresi (s)')
+    parser.add_argument('--ingest-workers', type=int, default=2)
+    parser.add_argument('--publish-workers', type=int, default=4)
+    parser.add_argument('--sweep-workers', type=lambda text: [int(value) for value in text.split(',')],
+                        help='Virgülle ayrılmış publish worker sayıları, ör. 1,2,4,8')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    parser.add_argument('--verbose', action='store_true', help='Uygulama loglarını göster')
+    args = parser.parse_args()
+
+    if args.sweep_workers:
+        results = sweep_workers(args, sys.argv[1:])
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_sweep(results)
+        return
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
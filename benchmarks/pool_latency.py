@@ -0,0 +1,94 @@
+"""Havuzlu (keep-alive) ve havuzsuz Graph API çağrılarının paylaşım başına gecikmesi.
+
+post_to_instagram'ı GraphStub'a karşı iki kez çalıştırır: önce her çağrıda yeni
+bağlantı açan düz requests.get/post ile, sonra app.py'nin graph_session'ı ile.
+Bir paylaşım üç çağrıdır: container oluştur, status_code sorgula, media_publish.
+
+Gerçek Graph API HTTPS olduğundan asıl fark TLS handshake'tedir; bunun için stub
+self-signed bir sertifikayla açılabilir:
+
+    openssl req -x509 -newkey rsa:2048 -nodes -days 1 -keyout key.pem -out cert.pem \\
+        -subj /CN=localhost -addext subjectAltName=IP:127.0.0.1
+    python benchmarks/pool_latency.py --cert cert.pem --key key.pem
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import requests
+
+from stubs import GraphStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def measure(app, session, runs):
+    app.graph_session = session
+    # İlk çağrı havuzu ısıtır, ölçüme girmez
+    app.post_to_instagram('https://example.com/a.jpg', 'benchmark')
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = app.post_to_instagram('https://example.com/a.jpg', 'benchmark')
+        latencies.append((time.perf_counter() - started) * 1000)
+        if 'id' not in result:
+            raise RuntimeError(f'Paylaşım başarısız: {result}')
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2)
+    }
+
+
+def run(args):
+    graph = GraphStub(image_delay=0)
+    if args.cert:
+        graph.use_tls(args.cert, args.key)
+        os.environ['REQUESTS_CA_BUNDLE'] = args.cert
+    graph.start()
+
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'INSTAGRAM_TOKEN': 'benchmark-token',
+        'GRAPH_API_URL': graph.url
+    })
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import app
+
+        graph_session = app.graph_session
+        # Modül seviyesindeki requests.get/post her çağrıda yeni session ve bağlantı açar
+        bare = measure(app, requests, args.runs)
+        pooled = measure(app, graph_session, args.runs)
+
+    return {'runs': args.runs, 'tls': bool(args.cert), 'bare': bare, 'pooled': pooled}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Graph API bağlantı havuzu gecikme karşılaştırması')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--cert', help='Stub için TLS sertifikası (PEM)')
+    parser.add_argument('--key', help='Sertifikanın özel anahtarı (PEM)')
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    args = parser.parse_args()
+    if bool(args.cert) != bool(args.key):
+        parser.error('--cert ve --key birlikte verilmeli')
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['runs']} paylaşım, {'HTTPS' if result['tls'] else 'HTTP'} stub")
+    for label in ('bare', 'pooled'):
+        print(f"{label:7}: p50 {result[label]['p50_ms']} ms, p95 {result[label]['p95_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Uzun süreli kullanıcı değişiminde oturum deposunun bellek kullanımı.
+
+Her turda bir sürü yeni kullanıcı medya yükleyip oturum açar ve bir daha dönmez.
+SESSION_MAX aşılınca en eski oturumlar hemen atılır, kalanlar SESSION_IDLE_TTL
+sonunda süpürülür. Her turun sonunda tracemalloc ile ölçülen bellek düz kalmalı.
+
+Sonunda asset_collector'ın işi çalıştırılır: atılan her oturumun medyası
+Cloudinary stub'ında silinmiş, bekleyen bir gönderinin de kullandığı medya ise
+silinmemiş olmalı. Bu koşullardan biri bozulursa betik hata koduyla çıkar.
+
+Örnek:
+    python benchmarks/session_churn.py --users 100000 --rounds 5 --session-max 1000
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from stubs import CloudinaryStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_ASSET = 'telegram_instagram/shared'
+
+
+def drain_writes(app):
+    batch = []
+    while not app.db_write_queue.empty():
+        batch.append(app.db_write_queue.get())
+    if batch:
+        app.flush_writes(batch)
+
+
+def run(args):
+    cloudinary_stub = CloudinaryStub().start()
+    db_dir = tempfile.mkdtemp(prefix='nexabot-churn-')
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'INSTAGRAM_TOKEN': 'benchmark-token',
+        'CLOUDINARY_UPLOAD_PREFIX': cloudinary_stub.url,
+        'CLOUDINARY_CLOUD_NAME': 'benchmark',
+        'CLOUDINARY_API_KEY': 'benchmark',
+        'CLOUDINARY_API_SECRET': 'benchmark',
+        'DB_PATH': os.path.join(db_dir, 'churn.db'),
+        'SESSION_MAX': str(args.session_max),
+        'SESSION_IDLE_TTL': str(args.ttl),
+        'ASSET_CLEANUP_GRACE': '0',
+        'ASSET_DELETE_RATE_PER_HOUR': '100000000'
+    })
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import app
+
+        app.init_db()
+        # Paylaşılmayı bekleyen bir gönderi aynı asset'i kullanıyor; silinmemeli
+        app.schedule_post(1, {
+            'media_url': 'https://res.cloudinary.test/shared.jpg',
+            'media_type': 'image',
+            'caption': 'shared',
+            'public_id': SHARED_ASSET
+        }, datetime.now() + timedelta(days=1))
+
+        tracemalloc.start()
+        rounds = []
+        users_per_round = args.users // args.rounds
+        user_id = 1000
+        for _ in range(args.rounds):
+            for index in range(users_per_round):
+                user_id += 1
+                public_id = SHARED_ASSET if index == 0 else f'telegram_instagram/u{user_id}'
+                app.set_session(user_id, {
+                    'state': 'waiting_caption',
+                    'media_url': f'https://res.cloudinary.test/{public_id}.jpg',
+                    'media_type': 'image',
+                    'public_id': public_id
+                })
+                if index % 1000 == 0:
+                    drain_writes(app)
+            time.sleep(args.ttl)
+            app.expire_idle_sessions()
+            drain_writes(app)
+            current, peak = tracemalloc.get_traced_memory()
+            rounds.append({
+                'sessions': len(app.user_sessions),
+                'traced_mb': round(current / (1024 * 1024), 2),
+                'peak_mb': round(peak / (1024 * 1024), 2)
+            })
+        tracemalloc.stop()
+
+        cleanup_started = time.time()
+        while app.collect_assets() == 0:
+            pass
+        cleanup_elapsed = time.time() - cleanup_started
+
+    expected = user_id - 1000 - args.rounds
+    return {
+        'users': user_id - 1000,
+        'session_max': args.session_max,
+        'rounds': rounds,
+        'cleanup': {
+            'expected_deleted': expected,
+            'deleted': len(cloudinary_stub.deleted_ids),
+            'delete_calls': cloudinary_stub.delete_calls,
+            'shared_asset_kept': SHARED_ASSET not in cloudinary_stub.deleted_ids,
+            'elapsed_s': round(cleanup_elapsed, 2)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Oturum deposu churn testi')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--session-max', type=int, default=1000)
+    parser.add_argument('--ttl', type=int, default=1, help='SESSION_IDLE_TTL, saniye')
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    args = parser.parse_args()
+
+    result = run(args)
+    cleanup = result['cleanup']
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['users']} kullanıcı, SESSION_MAX={result['session_max']}")
+        for number, round_result in enumerate(result['rounds'], start=1):
+            print(f"Tur {number}: {round_result['sessions']} oturum, bellek {round_result['traced_mb']} MB "
+                  f"(tepe {round_result['peak_mb']} MB)")
+        print(f"Temizlik: {cleanup['deleted']}/{cleanup['expected_deleted']} asset silindi, "
+              f"{cleanup['delete_calls']} çağrı, {cleanup['elapsed_s']}s; paylaşılan asset "
+              f"{'korundu' if cleanup['shared_asset_kept'] else 'SİLİNDİ'}")
+
+    if cleanup['deleted'] != cleanup['expected_deleted'] or not cleanup['shared_asset_kept']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Telegram -> Cloudinary medya aktarımının tepe bellek kullanımı.
+
+Aynı dosya iki yolla aktarılır ve tracemalloc ile tepe bellek ölçülür:
+
+- buffered: dosyanın tamamı indirilip tek parça yüklenir (eski bot.download_file yolu)
+- streaming: app.stream_to_cloudinary; upload_large her seferinde bir chunk okur
+
+Streaming yolunun tepe belleği dosya boyutundan bağımsız, birkaç chunk kadar
+kalmalı; değilse betik hata koduyla çıkar.
+
+Örnek:
+    python benchmarks/stream_memory.py --size 60MB
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+from loadtest import parse_size
+from stubs import CloudinaryStub, TelegramStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_PATH = 'media/stream-benchmark.mp4'
+
+
+def measure(transfer):
+    tracemalloc.start()
+    try:
+        transfer()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def run(args):
+    telegram = TelegramStub().start()
+    cloudinary_stub = CloudinaryStub().start()
+    telegram.files[FILE_PATH] = args.size
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'INSTAGRAM_TOKEN': 'benchmark-token',
+        'TELEGRAM_API_URL': telegram.url,
+        'CLOUDINARY_UPLOAD_PREFIX': cloudinary_stub.url,
+        'CLOUDINARY_CLOUD_NAME': 'benchmark',
+        'CLOUDINARY_API_KEY': 'benchmark',
+        'CLOUDINARY_API_SECRET': 'benchmark',
+        'DB_PATH': ':memory:',
+        'UPLOAD_CHUNK_SIZE': str(args.chunk_size)
+    })
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import app
+
+        def buffered():
+            url = app.TELEGRAM_FILE_URL.format(app.TELEGRAM_TOKEN, FILE_PATH)
+            data = app.telegram_session.get(url, timeout=(5, 60)).content
+            app.cloudinary.uploader.upload(io.BytesIO(data), resource_type='video', folder='telegram_instagram')
+
+        def streaming():
+            app.stream_to_cloudinary(FILE_PATH, args.size, 'video', {})
+
+        buffered_peak = measure(buffered)
+        streaming_peak = measure(streaming)
+
+    return {
+        'file_mb': round(args.size / (1024 * 1024), 1),
+        'chunk_mb': round(args.chunk_size / (1024 * 1024), 1),
+        'buffered_peak_mb': round(buffered_peak, 1),
+        'streaming_peak_mb': round(streaming_peak, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Medya aktarımı bellek ölçümü')
+    parser.add_argument('--size', type=parse_size, default='60MB')
+    parser.add_argument('--chunk-size', type=parse_size, default='6MB', help='UPLOAD_CHUNK_SIZE')
+    parser.add_argument('--json', action='store_true', help='Sonucu JSON olarak yazdır')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"Dosya {result['file_mb']} MB, chunk {result['chunk_mb']} MB")
+        print(f"buffered : tepe {result['buffered_peak_mb']} MB")
+        print(f"streaming: tepe {result['streaming_peak_mb']} MB")
+
+    # Okunan chunk ve gönderilen chunk aynı anda bellekte olabilir
+    if result['streaming_peak_mb'] > 3 * result['chunk_mb']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""Telegram Bot API, Instagram Graph API ve Cloudinary için yerel sahte sunucular.
+
+Benchmark'lar gerçek servislere gitmeden app.py'yi uçtan uca çalıştırabilsin diye
+her biri ayrı bir ThreadingHTTPServer olarak açılır. app.py'yi bunlara yönlendirmek
+için TELEGRAM_API_URL, GRAPH_API_URL ve CLOUDINARY_UPLOAD_PREFIX kullanılır.
+"""
+import itertools
+import json
+import ssl
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DOWNLOAD_BLOCK = 64 * 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = 64 * 1024  # başlık ve gövde tek pakette gitsin
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        remaining = length
+        # Büyük yüklemeleri belleğe almadan oku
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, DOWNLOAD_BLOCK)))
+        return length
+
+    def read_params(self):
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        if self.command == 'POST' and self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+        elif self.command in ('POST', 'DELETE'):
+            self.read_body()
+        return parsed.path, params
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Öldürülen istemcilerin (ör. lease_check) kopan bağlantıları hata sayılmaz
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubServer:
+    """Arka planda çalışan tek bir stub HTTP sunucusu."""
+
+    handler_class = StubHandler
+
+    def __init__(self):
+        handler = type(self.handler_class.__name__, (self.handler_class,), {'stub': self})
+        self.server = StubHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.scheme = 'http'
+
+    @property
+    def url(self):
+        return f'{self.scheme}://127.0.0.1:{self.server.server_port}'
+
+    def use_tls(self, certfile, keyfile):
+        """Sunucuyu HTTPS yapar; bağlantı kurma (TLS handshake) maliyetini ölçmek için."""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.scheme = 'https'
+        return self
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TelegramHandler(StubHandler):
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        path, params = self.read_params()
+        parts = path.strip('/').split('/')
+
+        # /file/bot<token>/<file_path>
+        if parts[0] == 'file':
+            self.send_file('/'.join(parts[2:]))
+            return
+
+        method = parts[-1]
+        handler = getattr(self.stub, f'api_{method}', None)
+        if handler is None:
+            self.send_json({'ok': True, 'result': True})
+            return
+        try:
+            self.send_json({'ok': True, 'result': handler(params)})
+        except TelegramError as e:
+            self.send_json({
+                'ok': False,
+                'error_code': e.code,
+                'description': e.description,
+                'parameters': e.parameters
+            }, status=e.code)
+
+    def send_file(self, file_path):
+        size = self.stub.files.get(file_path)
+        if size is None:
+            self.send_json({'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404)
+            return
+
+        content = self.stub.contents.get(file_path)
+        if content is not None:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            self.stub.downloaded_bytes += len(content)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+
+        # Her dosyanın içeriği farklı olsun ki içerik hash cache'i isabet etmesin
+        block = (file_path.encode() * (DOWNLOAD_BLOCK // len(file_path) + 1))[:DOWNLOAD_BLOCK]
+        remaining = size
+        while remaining > 0:
+            chunk = block[:min(remaining, DOWNLOAD_BLOCK)]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+        self.stub.downloaded_bytes += size
+
+
+class TelegramError(Exception):
+    def __init__(self, code, description, **parameters):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+class TelegramStub(StubServer):
+    """getUpdates, getFile, dosya indirme ve sendMessage/sendPhoto'yu taklit eder."""
+
+    handler_class = TelegramHandler
+
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.cond = threading.Condition()
+        self.files = {}  # file_path -> boyut
+        self.contents = {}  # file_path -> gerçek içerik (ör. JPEG); yoksa sahte baytlar
+        self.sent = deque()  # (zaman, chat_id, metin)
+        self.downloaded_bytes = 0
+        self.throttle_next = 0  # sıradaki bu kadar mesaj 429 ile reddedilir
+
+    # Benchmark tarafı
+    def push_media(self, user_id, kind, size, media_group_id=None, duration=10, content=None):
+        message_id = next(self.message_ids)
+        file_id = f'{kind}-{user_id}-{message_id}'
+        if content is not None:
+            size = len(content)
+            self.contents[f'media/{file_id}'] = content
+        self.files[f'media/{file_id}'] = size
+
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+        }
+        media = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': size}
+        if kind == 'video':
+            message['video'] = dict(media, width=720, height=1280, duration=duration)
+        else:
+            message['photo'] = [dict(media, width=1080, height=1080)]
+        if media_group_id:
+            message['media_group_id'] = media_group_id
+
+        return self.push_update({'message': message})
+
+    def push_text(self, user_id, text):
+        return self.push_update({'message': {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': text
+        }})
+
+    def push_update(self, update):
+        with self.cond:
+            update['update_id'] = next(self.update_ids)
+            self.updates.append(update)
+            self.cond.notify_all()
+        return update['update_id']
+
+    # Bot API metotları
+    def api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Nexabot', 'username': 'nexabot_stub'}
+
+    def api_getUpdates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        timeout = float(params.get('timeout', 0) or 0)
+        deadline = time.time() + timeout
+        with self.cond:
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.time() < deadline:
+                self.cond.wait(deadline - time.time())
+            return list(self.updates[:100])
+
+    def api_getFile(self, params):
+        file_id = params['file_id']
+        file_path = f'media/{file_id}'
+        return {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_size': self.files.get(file_path, 0),
+            'file_path': file_path
+        }
+
+    def api_sendMessage(self, params):
+        return self.record_sent(params, params.get('text', ''))
+
+    def api_sendPhoto(self, params):
+        return self.record_sent(params, params.get('caption', ''))
+
+    def record_sent(self, params, text):
+        if self.throttle_next > 0:
+            self.throttle_next -= 1
+            raise TelegramError(429, 'Too Many Requests: retry after 1', retry_after=1)
+        chat_id = int(params['chat_id'])
+        self.sent.append((time.time(), chat_id, text))
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text
+        }
+
+
+class GraphHandler(StubHandler):
+    def do_GET(self):
+        path, params = self.read_params()
+        self.send_json(self.stub.handle_get(path.strip('/'), params))
+
+    def do_POST(self):
+        path, params = self.read_params()
+        self.send_json(self.stub.handle_post(path.strip('/'), params))
+
+
+class GraphStub(StubServer):
+    """me/media, container status_code ve me/media_publish'i taklit eder.
+
+    Container'lar oluşturulduktan `image_delay` / `video_delay` saniye sonra FINISHED olur.
+    """
+
+    handler_class = GraphHandler
+
+    def __init__(self, image_delay=1.0, video_delay=5.0, quota_total=100):
+        super().__init__()
+        self.image_delay = image_delay
+        self.video_delay = video_delay
+        self.quota_total = quota_total
+        self.ids = itertools.count(1000)
+        self.containers = {}  # id -> hazır olacağı zaman
+        self.published = 0
+        self.publish_log = []  # (zaman, access_token)
+        self.lock = threading.Lock()
+
+    def handle_get(self, path, params):
+        if path == 'me':
+            token = params.get('access_token', '')
+            return {'user_id': f'ig-{token}', 'username': f'user_{token}'}
+        
+        if path == 'refresh_access_token':
+            return {'access_token': params.get('access_token'), 'token_type': 'bearer', 'expires_in': 5184000}
+        
+        if path == 'me/content_publishing_limit':
+            return {'data': [{'quota_usage': 0, 'config': {'quota_total': self.quota_total, 'quota_duration': 86400}}]}
+
+        ready_at = self.containers.get(path)
+        if ready_at is None:
+            return {'error': {'message': 'Unsupported get request', 'code': 100}}
+        return {'status_code': 'FINISHED' if time.time() >= ready_at else 'IN_PROGRESS', 'id': path}
+
+    def handle_post(self, path, params):
+        with self.lock:
+            new_id = str(next(self.ids))
+
+        if path == 'me/media':
+            if params.get('media_type') == 'CAROUSEL':
+                delay = 0.5
+            else:
+                delay = self.image_delay if 'image_url' in params else self.video_delay
+            self.containers[new_id] = time.time() + delay
+            return {'id': new_id}
+
+        if path == 'me/media_publish':
+            if params.get('creation_id') not in self.containers:
+                return {'error': {'message': 'Media ID is not available', 'code': 9007}}
+            with self.lock:
+                self.published += 1
+                self.publish_log.append((time.time(), params.get('access_token')))
+            return {'id': new_id}
+
+        return {'error': {'message': 'Unknown path', 'code': 100}}
+
+
+class CloudinaryHandler(StubHandler):
+    def do_POST(self):
+        self.send_json(self.stub.handle(self))
+
+    def do_DELETE(self):
+        self.send_json(self.stub.handle(self))
+
+
+class CloudinaryStub(StubServer):
+    """Tek parça ve chunk'lı (Content-Range) upload, destroy ve delete_resources."""
+
+    handler_class = CloudinaryHandler
+
+    def __init__(self):
+        super().__init__()
+        self.ids = itertools.count(1)
+        self.uploads = {}  # X-Unique-Upload-Id -> public_id
+        self.uploaded_bytes = 0
+        self.deleted = 0
+        self.deleted_ids = set()
+        self.delete_calls = 0
+        self.lock = threading.Lock()
+
+    def handle(self, request):
+        path = urlparse(request.path).path.strip('/')
+        # v1_1/<cloud>/<resource_type>/<action> veya v1_1/<cloud>/resources/<resource_type>/upload
+        parts = path.split('/')
+
+        if parts[2] == 'resources':
+            # Admin API parametreleri query string'de ya da form gövdesinde gelebilir
+            body = request.rfile.read(int(request.headers.get('Content-Length', 0))).decode()
+            params = parse_qs(urlparse(request.path).query)
+            params.update(parse_qs(body))
+            # public_ids[] ya da public_ids[0], public_ids[1] ... biçiminde
+            public_ids = [value for key, values in params.items() if key.startswith('public_ids[') for value in values]
+            with self.lock:
+                self.deleted += len(public_ids)
+                self.deleted_ids.update(public_ids)
+                self.delete_calls += 1
+            return {'deleted': {public_id: 'deleted' for public_id in public_ids}, 'partial': False}
+
+        size = request.read_body()
+
+        resource_type, action = parts[2], parts[3]
+        if action == 'destroy':
+            with self.lock:
+                self.deleted += 1
+            return {'result': 'ok'}
+
+        with self.lock:
+            self.uploaded_bytes += size
+            upload_id = request.headers.get('X-Unique-Upload-Id') or f'single-{next(self.ids)}'
+            public_id = self.uploads.setdefault(upload_id, f'telegram_instagram/stub{next(self.ids)}')
+
+        extension = 'mp4' if resource_type == 'video' else 'jpg'
+        result = {
+            'public_id': public_id,
+            'resource_type': resource_type,
+            'secure_url': f'https://res.cloudinary.test/{public_id}.{extension}',
+            'bytes': size
+        }
+        if resource_type == 'video':
+            result['duration'] = 10.0
+        return result